@@ -0,0 +1,59 @@
+# Gunicorn settings, read from the working directory (/app in the container).
+# Every value can be overridden from the environment; the measurements behind
+# the defaults are in day_10_gunicorn.md.
+import gc
+import multiprocessing
+import os
+
+cpus = multiprocessing.cpu_count()
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+# uvicorn workers (the uvicorn-worker package) serve the async read views
+# from random_posts.asgi:application; "sync" and "gthread" serve
+# random_posts.wsgi:application
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "uvicorn_worker.UvicornWorker")
+if worker_class == "sync":
+    # a sync worker is busy for the whole request, database waits included
+    workers = int(os.getenv("GUNICORN_WORKERS", cpus * 2 + 1))
+    threads = 1
+elif worker_class == "gthread":
+    workers = int(os.getenv("GUNICORN_WORKERS", cpus + 1))
+    threads = int(os.getenv("GUNICORN_THREADS", 4))
+else:
+    # an event loop per worker keeps one core busy
+    workers = int(os.getenv("GUNICORN_WORKERS", cpus))
+    threads = 1
+
+# load Django once in the master and fork the workers from it: they start
+# at once and share the master's memory pages until they write to them
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+# recycle each worker after about this many requests to bound slow leaks;
+# the jitter keeps the workers from restarting all at once
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", max_requests // 10))
+# a recycled or reloaded worker gets this long to finish its requests
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+# nginx keeps connections to the workers open between requests
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+    from django.db import connections
+    from posts_app.warmup import warm_up
+
+    templates, urls = warm_up()
+    server.log.info("Warmed up %d templates and %d URL names before forking", templates, urls)
+    # nothing opened in the master may be shared by the workers
+    connections.close_all()
+    # the objects loaded so far live as long as the process; move them out of
+    # the collector's reach so collections in the workers don't touch (and
+    # copy) their pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    server.log.info("Worker %s started (%s, %d thread(s))", worker.pid, worker_class, threads)
@@ -1,6 +1,10 @@
 from django.contrib import admin
-from .models import Post,CustomUser
+from .models import Post,CustomUser,ImageProcessingJob,BannedWord,Category,Follow
 # Register your models here.
 
 admin.site.register(CustomUser)
-admin.site.register(Post)
\ No newline at end of file
+admin.site.register(Post)
+admin.site.register(ImageProcessingJob)
+admin.site.register(BannedWord)
+admin.site.register(Category)
+admin.site.register(Follow)
@@ -0,0 +1,219 @@
+"""
+Read-only JSON API: /api/posts/ (public posts, newest first) and
+/api/users/ (active members by id).
+
+    ?fields=id,excerpt   the fields of each row, from the view's FIELDS
+    ?limit=500           rows per response (default 100, 0 for all of them)
+    ?after=<next>        continue where the previous response stopped
+
+    {"results": [{...}, ...], "next": "<cursor>" or null}
+
+Rows are read with values() from a server-side cursor and written out in
+batches as they arrive, so an export of millions of rows holds one batch
+in memory, not the whole result.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import F
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
+from .models import CustomUser, Post
+from .pagination import InvalidCursor, KeysetPaginator
+import datetime
+import decimal
+import json
+import uuid
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# rows fetched per round trip by the server-side cursor
+CHUNK_SIZE = 2000
+# rows serialized per write to the client
+BATCH_SIZE = 500
+DEFAULT_LIMIT = 100
+
+
+def _default(value):
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(value):
+    # orjson is several times faster than json and writes datetimes the same way
+    if orjson is not None:
+        return orjson.dumps(value, default=_default)
+    return json.dumps(value, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class JsonRowsWriter:
+    """Turns rows into the chunks of the response body, BATCH_SIZE rows at a time."""
+
+    def __init__(self, fields, limit, paginator):
+        self.fields = fields
+        self.limit = limit
+        self.paginator = paginator
+        self.batch = []
+        self.written = 0
+        self.last = None
+        self.more = False
+
+    def start(self):
+        return b'{"results":['
+
+    def add(self, row):
+        if self.limit and self.written + len(self.batch) == self.limit:
+            # the one row fetched past the limit: there is a next page
+            self.more = True
+            return b""
+        self.last = row
+        self.batch.append({name: row[name] for name in self.fields})
+        if len(self.batch) >= BATCH_SIZE:
+            return self.flush()
+        return b""
+
+    def flush(self):
+        if not self.batch:
+            return b""
+        # the rows without the list's brackets
+        chunk = dumps(self.batch)[1:-1]
+        if self.written:
+            chunk = b"," + chunk
+        self.written += len(self.batch)
+        self.batch = []
+        return chunk
+
+    def finish(self):
+        next_cursor = self.paginator.cursor_for(self.last) if self.more else None
+        return self.flush() + b'],"next":' + dumps(next_cursor) + b"}"
+
+
+def stream_rows(queryset, writer):
+    yield writer.start()
+    for row in queryset.iterator(chunk_size=CHUNK_SIZE):
+        chunk = writer.add(row)
+        if chunk:
+            yield chunk
+    yield writer.finish()
+
+
+async def astream_rows(queryset, writer):
+    yield writer.start()
+    async for row in queryset.aiterator(chunk_size=CHUNK_SIZE):
+        chunk = writer.add(row)
+        if chunk:
+            yield chunk
+    yield writer.finish()
+
+
+class StreamingJsonListView(View):
+    # {output name: ORM lookup}
+    FIELDS = {}
+    DEFAULT_FIELDS = ()
+    # the rows listed: queryset, else every row of model
+    queryset = None
+    model = None
+    # must end with a unique column, see KeysetPaginator
+    ordering = ("id",)
+    read_from_replica = True
+
+    def get_queryset(self):
+        if self.queryset is not None:
+            return self.queryset.all()
+        if self.model is not None:
+            return self.model._default_manager.all()
+        raise ImproperlyConfigured(f"{type(self).__name__} needs a queryset or a model")
+
+    def get_fields(self):
+        requested = self.request.GET.get("fields")
+        if not requested:
+            return list(self.DEFAULT_FIELDS)
+        fields = list(dict.fromkeys(name.strip() for name in requested.split(",") if name.strip()))
+        unknown = [name for name in fields if name not in self.FIELDS]
+        if unknown or not fields:
+            raise ValueError(f"Unknown fields {', '.join(unknown)}; choose from {', '.join(self.FIELDS)}")
+        return fields
+
+    def get_limit(self):
+        limit = self.request.GET.get("limit", DEFAULT_LIMIT)
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = -1
+        if limit < 0:
+            raise ValueError("limit must be a whole number, 0 for no limit")
+        return limit
+
+    def get(self, request, *args, **kwargs):
+        try:
+            fields = self.get_fields()
+            limit = self.get_limit()
+            queryset = self.get_queryset()
+            paginator = KeysetPaginator(queryset, limit, self.ordering)
+            after = request.GET.get("after")
+            if after:
+                queryset = queryset.filter(paginator.seek_filter(paginator.decode(after)))
+        except (ValueError, InvalidCursor) as error:
+            return JsonResponse({"error": str(error)}, status=400)
+
+        # the cursor needs the ordering columns, selected or not
+        columns = list(dict.fromkeys(fields + [name.lstrip("-") for name in self.ordering]))
+        queryset = queryset.order_by(*self.ordering).values(
+            *[name for name in columns if self.FIELDS.get(name, name) == name],
+            **{name: F(self.FIELDS[name]) for name in columns if self.FIELDS.get(name, name) != name},
+        )
+        if limit:
+            queryset = queryset[: limit + 1]
+        # the body is read after the replica middleware has returned, so the
+        # replica it chose is pinned here
+        if getattr(request, "read_replica", None):
+            queryset = queryset.using(request.read_replica)
+
+        writer = JsonRowsWriter(fields, limit, paginator)
+        # a server streams the iterator kind it runs (it would read the other
+        # kind into a list first)
+        if isinstance(request, ASGIRequest):
+            content = astream_rows(queryset, writer)
+        else:
+            content = stream_rows(queryset, writer)
+        return StreamingHttpResponse(content, content_type="application/json")
+
+
+class PostsApiView(StreamingJsonListView):
+    FIELDS = {
+        "id": "id",
+        "user_id": "user_id",
+        "username": "user__username",
+        "excerpt": "excerpt",
+        "content": "content",
+        "categories": "categories",
+        "created_at": "created_at",
+        "updated_at": "updated_at",
+        "image": "image",
+        "image_width": "image_width",
+        "image_height": "image_height",
+    }
+    DEFAULT_FIELDS = ("id", "user_id", "excerpt", "categories", "created_at")
+    ordering = ("-created_at", "-id")
+    # a scan of posts_public_created_idx, like /posts/
+    queryset = Post.objects.filter(visibility="public")
+
+
+class UsersApiView(StreamingJsonListView):
+    # no email, phone number or password, and no staff or deactivated accounts
+    FIELDS = {
+        "id": "id",
+        "username": "username",
+        "first_name": "first_name",
+        "last_name": "last_name",
+        "bio": "bio",
+        "date_joined": "date_joined",
+        "follower_count": "follower_count",
+    }
+    DEFAULT_FIELDS = ("id", "username", "date_joined")
+    queryset = CustomUser.objects.filter(is_active=True, is_staff=False, is_superuser=False)
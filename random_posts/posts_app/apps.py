@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class PostsAppConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "posts_app"
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .log_handlers import start_listeners
+
+        start_listeners()
@@ -0,0 +1,66 @@
+"""
+Async get() for the read-only list and detail views, so an ASGI worker
+(uvicorn) serves them from its event loop instead of a thread per request.
+
+The rows are loaded with Django's async ORM. The template is rendered in a
+worker thread, as Django does for a TemplateResponse: rendering is CPU work
+and the card fragments are read from the cache, which would both stall the
+event loop. The template must not hit the database, so request.user is
+loaded up front with request.auser() and the querysets select_related what
+the pages show.
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.shortcuts import aget_object_or_404
+from django.template.loader import select_template
+
+
+class AsyncRenderMixin:
+    async def load_user(self, request):
+        # requests built without the middleware (RequestFactory) have no auser
+        if hasattr(request, "auser"):
+            request.user = await request.auser()
+
+    def render_page(self, context):
+        template = select_template(self.get_template_names())
+        return HttpResponse(template.render(context, self.request))
+
+    async def render_now(self, context):
+        return await sync_to_async(self.render_page)(context)
+
+
+class AsyncListMixin(AsyncRenderMixin):
+    async def get(self, request, *args, **kwargs):
+        await self.load_user(request)
+        self.object_list = await self.aget_queryset()
+        page_size = self.get_paginate_by(self.object_list)
+        if page_size:
+            self.page = await self.apaginate_queryset(self.object_list, page_size)
+        else:
+            self.object_list = [obj async for obj in self.object_list]
+        return await self.render_now(self.get_context_data())
+
+    async def aget_queryset(self):
+        # override when building the queryset itself needs a query
+        return self.get_queryset()
+
+    def paginate_queryset(self, queryset, page_size):
+        # the page was loaded by get()
+        return self.page
+
+
+class AsyncDetailMixin(AsyncRenderMixin):
+    async def get(self, request, *args, **kwargs):
+        await self.load_user(request)
+        self.object = await self.aget_object()
+        return await self.render_now(self.get_context_data(object=self.object))
+
+    async def aget_object(self):
+        queryset = self.get_queryset()
+        pk = self.kwargs.get(self.pk_url_kwarg)
+        slug = self.kwargs.get(self.slug_url_kwarg)
+        if pk is not None:
+            queryset = queryset.filter(pk=pk)
+        if slug is not None:
+            queryset = queryset.filter(**{self.get_slug_field(): slug})
+        return await aget_object_or_404(queryset)
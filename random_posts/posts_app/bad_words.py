@@ -0,0 +1,160 @@
+"""
+Bad word matching for validate_no_bad_words.
+
+The word list (settings.BAD_WORDS + settings.BAD_WORDS_FILE + the BannedWord
+table) is compiled into one regex shaped like a trie: words sharing a prefix
+share a branch, so at each position of the text the engine follows the one
+branch matching the next character instead of trying every word. The work
+per position grows with the length of the longest word prefix found there,
+not with the number of words.
+
+The compiled matcher is shared by the process. Saving or deleting a
+BannedWord bumps a version number in the default cache (see changed()), and
+the processes compare it, and the mtime of BAD_WORDS_FILE, with what they
+compiled at most every settings.BAD_WORDS_RELOAD_INTERVAL seconds: the
+table itself is only read to rebuild the matcher.
+"""
+import os
+import re
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+
+VERSION_KEY = "bad_words:version"
+
+
+def trie_pattern(words, whole_words=False):
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+    pattern = _node_pattern(trie, whole_words)
+    if whole_words:
+        # lookarounds rather than \b so words starting or ending with
+        # punctuation still match
+        return rf"(?<!\w)(?:{pattern})(?!\w)"
+    return pattern
+
+
+def _node_pattern(node, whole_words):
+    ends_here = "" in node
+    if ends_here and not whole_words:
+        # a substring search is already satisfied, longer words add nothing
+        return ""
+    branches = []
+    single_chars = []
+    for char, child in sorted(node.items()):
+        if char == "":
+            continue
+        rest = _node_pattern(child, whole_words)
+        if rest:
+            branches.append(re.escape(char) + rest)
+        else:
+            single_chars.append(re.escape(char))
+    if single_chars:
+        branches.append(single_chars[0] if len(single_chars) == 1 else "[" + "".join(single_chars) + "]")
+    pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    if ends_here:
+        return f"(?:{pattern})?"
+    return pattern
+
+
+class BadWordMatcher:
+    def __init__(self, words, whole_words=False):
+        self.words = frozenset(word.strip().lower() for word in words if word.strip())
+        self.whole_words = whole_words
+        self.regex = re.compile(trie_pattern(self.words, whole_words)) if self.words else None
+
+    def search(self, text):
+        """Return the first bad word in text, or None."""
+        if self.regex is None:
+            return None
+        match = self.regex.search(text.lower())
+        return match.group() if match else None
+
+    def find(self, values):
+        """Indexes of the values containing a bad word; a clean batch costs one scan."""
+        if self.regex is None or not self.regex.search("\n".join(values).lower()):
+            return []
+        return [index for index, value in enumerate(values) if self.regex.search(value.lower())]
+
+
+def read_word_file(path):
+    with open(path, encoding="utf-8") as words:
+        return [line.split("#", 1)[0] for line in words]
+
+
+def _source_version():
+    path = settings.BAD_WORDS_FILE
+    return (
+        tuple(settings.BAD_WORDS),
+        settings.BAD_WORDS_WHOLE_WORDS,
+        path,
+        os.stat(path).st_mtime_ns if path else None,
+        cache.get(VERSION_KEY),
+    )
+
+
+def _load():
+    from .models import BannedWord
+
+    words = list(settings.BAD_WORDS)
+    if settings.BAD_WORDS_FILE:
+        words += read_word_file(settings.BAD_WORDS_FILE)
+    words += BannedWord.objects.values_list("word", flat=True)
+    return BadWordMatcher(words, whole_words=settings.BAD_WORDS_WHOLE_WORDS)
+
+
+_lock = threading.Lock()
+_state = {"matcher": None, "version": None, "checked": 0.0}
+
+
+def get_matcher():
+    if _state["matcher"] is not None and time.monotonic() - _state["checked"] < settings.BAD_WORDS_RELOAD_INTERVAL:
+        return _state["matcher"]
+    if not _lock.acquire(blocking=_state["matcher"] is None):
+        # another thread is checking or recompiling, keep using the current list
+        return _state["matcher"]
+    try:
+        version = _source_version()
+        if version != _state["version"]:
+            _state["matcher"] = _load()
+            _state["version"] = version
+        _state["checked"] = time.monotonic()
+    finally:
+        _lock.release()
+    return _state["matcher"]
+
+
+def reload():
+    """Rebuild the matcher on the next get_matcher() call."""
+    _state["version"] = None
+    _state["checked"] = float("-inf")
+
+
+def changed():
+    """The BannedWord table changed: rebuild here now, in the other processes once committed."""
+    reload()
+    transaction.on_commit(_bump_version)
+
+
+def _bump_version():
+    # add() then incr() so two processes bumping at once both count
+    cache.add(VERSION_KEY, 0, None)
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # evicted in between; any new value tells the others to rebuild
+        cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+@receiver(setting_changed)
+def reload_on_setting_change(setting, **kwargs):
+    if setting.startswith("BAD_WORDS"):
+        reload()
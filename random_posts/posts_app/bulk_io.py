@@ -0,0 +1,281 @@
+"""
+Streaming CSV / JSON-lines import and export for Post and CustomUser.
+
+On PostgreSQL rows move through COPY, everywhere else through chunked ORM
+queries. Imported rows run the model field validators column by column so
+checks with a batch form (see BATCH_VALIDATORS) scan a whole batch at once.
+"""
+import codecs
+import csv
+import datetime
+import io
+import json
+from django.contrib.postgres.search import SearchVectorField
+from django.core.exceptions import ValidationError
+from django.core.management.color import no_style
+from django.db import connection, models, transaction
+from django.utils import timezone
+from .models import CustomUser, Post
+from .validators import find_bad_words, validate_no_bad_words, validate_username
+
+MODELS = {"posts": Post, "users": CustomUser}
+NULL = "\\N"
+
+# validator -> function(values) returning the indexes of invalid values
+BATCH_VALIDATORS = {validate_no_bad_words: find_bad_words}
+# validators applied by Model.clean() rather than declared on the field
+EXTRA_VALIDATORS = {CustomUser: {"username": [validate_username]}}
+
+
+def use_copy():
+    return connection.vendor == "postgresql"
+
+
+def is_psycopg3():
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+    return is_psycopg3
+
+
+def export_fields(model):
+    # the search vector is derived data, the PostgreSQL trigger rebuilds it
+    return [field for field in model._meta.concrete_fields if not isinstance(field, SearchVectorField)]
+
+
+def to_text(field, value):
+    if value is None:
+        return NULL
+    if isinstance(field, models.JSONField):
+        return json.dumps(value)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return str(value)
+
+
+def from_text(field, value):
+    if value == NULL:
+        return None
+    if isinstance(field, models.JSONField):
+        return json.loads(value)
+    return field.to_python(value)
+
+
+def to_json(field, value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return value
+
+
+def from_json(field, value):
+    if value is None or isinstance(field, models.JSONField):
+        return value
+    return field.to_python(value)
+
+
+# --- export -----------------------------------------------------------------
+
+
+def export_rows(model, output, file_format, chunk_size=2000):
+    """Write every row of model to output; returns the number of rows."""
+    fields = export_fields(model)
+    if file_format == "csv" and use_copy():
+        return _copy_out(model, fields, output)
+
+    rows = model._default_manager.order_by("pk").values_list(*[f.attname for f in fields]).iterator(chunk_size=chunk_size)
+    count = 0
+    if file_format == "csv":
+        writer = csv.writer(output)
+        writer.writerow([f.attname for f in fields])
+        for row in rows:
+            writer.writerow([to_text(field, value) for field, value in zip(fields, row)])
+            count += 1
+    else:
+        for row in rows:
+            record = {field.attname: to_json(field, value) for field, value in zip(fields, row)}
+            output.write(json.dumps(record) + "\n")
+            count += 1
+    return count
+
+
+def _copy_out(model, fields, output):
+    quote = connection.ops.quote_name
+    columns = ", ".join(quote(f.column) for f in fields)
+    # the header uses attnames so files stay portable to the ORM path
+    csv.writer(output).writerow([f.attname for f in fields])
+    sql = (
+        f"COPY (SELECT {columns} FROM {quote(model._meta.db_table)} ORDER BY {quote(model._meta.pk.column)}) "
+        f"TO STDOUT WITH (FORMAT csv, NULL '{NULL}')"
+    )
+    with connection.cursor() as cursor:
+        if is_psycopg3():
+            decoder = codecs.getincrementaldecoder("utf-8")()
+            with cursor.copy(sql) as copy:
+                for data in copy:
+                    output.write(decoder.decode(bytes(data)))
+        else:
+            cursor.copy_expert(sql, output)
+        return cursor.rowcount
+
+
+# --- import -----------------------------------------------------------------
+
+
+def read_rows(model, source, file_format):
+    """
+    Yield ({attname: python value}, [messages]) pairs from a CSV or JSON-lines
+    file. A row that cannot be read comes with the messages saying why and
+    is to be skipped like the ones failing validation.
+    """
+    fields = {f.attname: f for f in export_fields(model)}
+    if file_format == "csv":
+        reader = csv.reader(source)
+        # next() raising StopIteration inside a generator becomes a RuntimeError
+        header = next(reader, None)
+        if header is None:
+            raise ValueError("The file is empty, expected a header line")
+        unknown = set(header) - set(fields)
+        if unknown:
+            raise ValueError(f"Unknown columns: {', '.join(sorted(unknown))}")
+        for line in reader:
+            if len(line) != len(header):
+                yield {}, [f"{len(line)} values for {len(header)} columns"]
+                continue
+            yield convert_row(fields, zip(header, line), from_text)
+    else:
+        for line in source:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as error:
+                yield {}, [f"invalid JSON: {error}"]
+                continue
+            if not isinstance(record, dict):
+                yield {}, ["not a JSON object"]
+                continue
+            yield convert_row(fields, record.items(), from_json)
+
+
+def convert_row(fields, items, convert):
+    row = {}
+    errors = []
+    for name, value in items:
+        if name not in fields:
+            errors.append(f"{name}: unknown column")
+            continue
+        try:
+            row[name] = convert(fields[name], value)
+        except (TypeError, ValueError, ValidationError) as error:
+            messages = error.messages if isinstance(error, ValidationError) else [str(error)]
+            errors.append(f"{name}: {'; '.join(messages)}")
+    return row, errors
+
+
+def validate_batch(model, rows):
+    """Return {row index: [messages]} for the rows failing validation."""
+    errors = {}
+    extra = EXTRA_VALIDATORS.get(model, {})
+    for field in export_fields(model):
+        name = field.attname
+        if field.is_relation or field.primary_key or not any(name in row for row in rows):
+            continue
+        column = [row.get(name) for row in rows]
+        per_value = list(field.validators) + extra.get(name, [])
+        for validator, batch_validator in BATCH_VALIDATORS.items():
+            if validator in per_value:
+                per_value.remove(validator)
+                present = [(index, value) for index, value in enumerate(column) if value not in field.empty_values]
+                for position in batch_validator([value for _, value in present]):
+                    errors.setdefault(present[position][0], []).append(f"{name}: contains bad words")
+        if not per_value:
+            continue
+        for index, value in enumerate(column):
+            if value in field.empty_values:
+                continue
+            try:
+                for validator in per_value:
+                    validator(value)
+            except ValidationError as error:
+                errors.setdefault(index, []).append(f"{name}: {'; '.join(error.messages)}")
+    return errors
+
+
+def fill_defaults(model, rows):
+    """
+    Complete rows with the values Model() and save() would give the missing
+    fields. COPY leaves the columns it is not given to the database defaults,
+    and Django creates none.
+    """
+    now = timezone.now()
+    filled = []
+    for row in rows:
+        values = {}
+        for field in export_fields(model):
+            name = field.attname
+            if field.primary_key and row.get(name) is None:
+                # left out: the id sequence picks it
+                continue
+            if name in row:
+                values[name] = row[name]
+            elif getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False):
+                values[name] = now
+            else:
+                values[name] = field.get_default()
+        filled.append(values)
+    return filled
+
+
+def copy_in(model, names, rows):
+    fields = {f.attname: f for f in export_fields(model)}
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([to_text(fields[name], row[name]) for name in names])
+    quote = connection.ops.quote_name
+    columns = ", ".join(quote(fields[name].column) for name in names)
+    sql = f"COPY {quote(model._meta.db_table)} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '{NULL}')"
+    with connection.cursor() as cursor:
+        if is_psycopg3():
+            with cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+        else:
+            buffer.seek(0)
+            cursor.copy_expert(sql, buffer)
+
+
+def write_batch(model, rows):
+    if not rows:
+        return
+    fields = {f.attname: f for f in export_fields(model)}
+    with transaction.atomic():
+        if use_copy():
+            # one COPY per column list: rows with an id and rows without
+            groups = {}
+            for row in fill_defaults(model, rows):
+                groups.setdefault(tuple(row), []).append(row)
+            for names, group in groups.items():
+                copy_in(model, names, group)
+        else:
+            objects = model._default_manager.bulk_create([model(**row) for row in rows])
+            # bulk_create stamps auto_now fields with the current time; put
+            # the exported values back
+            stamped = [
+                f.attname for f in fields.values()
+                if getattr(f, "auto_now", False) or getattr(f, "auto_now_add", False)
+            ]
+            changed = set()
+            for obj, row in zip(objects, rows):
+                for name in stamped:
+                    if row.get(name) is not None:
+                        setattr(obj, name, row[name])
+                        changed.add(name)
+            if changed:
+                model._default_manager.bulk_update(objects, sorted(changed))
+
+
+def reset_sequences(model):
+    # COPY keeps the exported ids but does not advance the id sequence
+    statements = connection.ops.sequence_reset_sql(no_style(), [model])
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
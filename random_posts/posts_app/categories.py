@@ -0,0 +1,120 @@
+"""
+Keeps Category / PostCategory in step with the free-text Post.categories.
+
+Post.categories stays what the author typed ("News, Local sport"). Each
+comma separated name becomes a Category, matched by slug, and a PostCategory
+link carrying the post's created_at, so a category page is one range scan of
+the link index. Category.post_count is adjusted in the same transaction as
+the links.
+"""
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils.text import slugify
+from .models import Category, Post, PostCategory
+
+MAX_CATEGORIES = 10
+
+
+def split_categories(text):
+    """Return {slug: name} for the comma separated names in text."""
+    names = {}
+    for name in (text or "").split(","):
+        name = " ".join(name.split())[:100]
+        slug = slugify(name, allow_unicode=True)[:100]
+        if slug and slug not in names and len(names) < MAX_CATEGORIES:
+            names[slug] = name
+    return names
+
+
+def get_categories(names):
+    """{slug: name} -> {slug: Category}, creating the missing ones."""
+    categories = Category.objects.in_bulk(list(names), field_name="slug")
+    missing = [Category(slug=slug, name=name) for slug, name in names.items() if slug not in categories]
+    if missing:
+        Category.objects.bulk_create(missing, ignore_conflicts=True)
+        categories = Category.objects.in_bulk(list(names), field_name="slug")
+        # the insert also skips a name that exists under another slug (one
+        # edited in the admin): use that category
+        unmatched = {name: slug for slug, name in names.items() if slug not in categories}
+        for category in Category.objects.filter(name__in=list(unmatched)):
+            categories[unmatched[category.name]] = category
+    return categories
+
+
+def adjust_counts(deltas):
+    """Add {category id: change} to Category.post_count in one UPDATE."""
+    deltas = {pk: change for pk, change in deltas.items() if change}
+    if deltas:
+        Category.objects.filter(pk__in=deltas).update(
+            post_count=F("post_count")
+            + Case(*[When(pk=pk, then=Value(change)) for pk, change in deltas.items()], output_field=IntegerField())
+        )
+
+
+def sync_links(posts):
+    """
+    Bring the links of posts (objects with pk, categories and created_at)
+    in line with their categories text. Works in batches: a handful of
+    queries whatever the number of posts.
+    """
+    posts = list(posts)
+    if posts:
+        with transaction.atomic():
+            _sync_links(posts)
+
+
+def _sync_links(posts):
+    names = {post.pk: split_categories(post.categories) for post in posts}
+    categories = get_categories({slug: name for found in names.values() for slug, name in found.items()})
+    # by category id: a category matched by name has another slug than the text's
+    wanted = {pk: {categories[slug].pk for slug in found if slug in categories} for pk, found in names.items()}
+    existing = {}
+    for link in PostCategory.objects.filter(post__in=list(wanted)).only("id", "post_id", "category_id", "created_at"):
+        existing.setdefault(link.post_id, {})[link.category_id] = link
+
+    added, removed, moved = [], [], []
+    deltas = {}
+    for post in posts:
+        current = existing.get(post.pk, {})
+        for category_id in wanted[post.pk] - current.keys():
+            added.append(PostCategory(post_id=post.pk, category_id=category_id, created_at=post.created_at))
+            deltas[category_id] = deltas.get(category_id, 0) + 1
+        for category_id in current.keys() - wanted[post.pk]:
+            removed.append(current[category_id].pk)
+            deltas[category_id] = deltas.get(category_id, 0) - 1
+        for category_id in current.keys() & wanted[post.pk]:
+            if current[category_id].created_at != post.created_at:
+                current[category_id].created_at = post.created_at
+                moved.append(current[category_id])
+    PostCategory.objects.bulk_create(added, batch_size=1000)
+    if removed:
+        PostCategory.objects.filter(pk__in=removed).delete()
+    PostCategory.objects.bulk_update(moved, ["created_at"], batch_size=1000)
+    adjust_counts(deltas)
+
+
+def unlink_post(post):
+    """Called before a post is deleted; the links go with it by cascade."""
+    deltas = {}
+    for category_id in PostCategory.objects.filter(post=post).values_list("category_id", flat=True):
+        deltas[category_id] = deltas.get(category_id, 0) - 1
+    adjust_counts(deltas)
+
+
+def post_saved(post, created):
+    loaded = post._loaded_values
+    if not created and loaded.get("categories") == post.categories and loaded.get("created_at") == post.created_at:
+        return
+    sync_links([post])
+
+
+def link_new_posts(batch_size=2000):
+    """Link the posts written without signals (bulk_create, COPY)."""
+    linked = 0
+    last_id = 0
+    unlinked = Post.objects.filter(category_links__isnull=True).exclude(categories="").order_by("id")
+    while batch := list(unlinked.filter(id__gt=last_id).only("id", "categories", "created_at")[:batch_size]):
+        sync_links(batch)
+        linked += len(batch)
+        last_id = batch[-1].id
+    return linked
@@ -0,0 +1,32 @@
+"""
+The excerpt stored on each post: the first EXCERPT_LENGTH characters of its
+content, which is all a listing page loads and shows. Post.save keeps it in
+step; rows written without save (bulk_create, COPY, rows from before the
+column existed) are filled in by backfill_excerpts.
+"""
+from django.db import connection, transaction
+from django.utils.text import Truncator
+
+EXCERPT_LENGTH = 200
+
+
+def make_excerpt(content):
+    # plain text like the content itself, escaped when rendered; Truncator
+    # cuts at a character and ends the cut with an ellipsis
+    return Truncator(" ".join(content.split())).chars(EXCERPT_LENGTH)
+
+
+def backfill_excerpts(model, batch_size=2000):
+    """Fill in the missing excerpts one transaction per batch, yielding each batch once written."""
+    last_id = 0
+    missing = model._default_manager.filter(excerpt__isnull=True).order_by("id")
+    quote = connection.ops.quote_name
+    # a CASE per row (bulk_update) is ~20x slower than a prepared UPDATE per row
+    sql = f"UPDATE {quote(model._meta.db_table)} SET {quote('excerpt')} = %s WHERE {quote('id')} = %s"
+    while batch := list(missing.filter(id__gt=last_id).only("id", "content", "updated_at")[:batch_size]):
+        for post in batch:
+            post.excerpt = make_excerpt(post.content)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, [(post.excerpt, post.id) for post in batch])
+        last_id = batch[-1].id
+        yield batch
@@ -0,0 +1,130 @@
+"""
+The follow graph and the /feed/ timelines.
+
+A new post is copied into the timeline of every follower of its author
+(fan-out on write, one TimelineEntry per follower), so reading a feed page
+is a range scan of timeline_entries_feed_idx whatever the number of authors
+followed. Authors with more than FEED_FANOUT_MAX_FOLLOWERS followers are
+not copied: once past it they are marked feed_pull for good, their Follow
+rows get pull=True, and each feed page merges in their latest posts read
+at request time (the hybrid pull path).
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from .models import CustomUser, Follow, Post, TimelineEntry
+from .pagination import KeysetPaginator
+
+BATCH_SIZE = 1000
+
+
+def follow(follower, followee):
+    """Return False when follower already follows followee."""
+    if follower.pk == followee.pk:
+        raise ValueError("Users cannot follow themselves")
+    with transaction.atomic():
+        # serializes the follows of one author, so the switch to the pull
+        # path happens exactly once
+        author = CustomUser.objects.select_for_update().only("feed_pull", "follower_count").get(pk=followee.pk)
+        _, created = Follow.objects.get_or_create(follower=follower, followee=author, defaults={"pull": author.feed_pull})
+        if not created:
+            return False
+        CustomUser.objects.filter(pk=author.pk).update(follower_count=F("follower_count") + 1)
+        if author.feed_pull:
+            return True
+        if author.follower_count + 1 > settings.FEED_FANOUT_MAX_FOLLOWERS:
+            CustomUser.objects.filter(pk=author.pk).update(feed_pull=True)
+            Follow.objects.filter(followee=author).update(pull=True)
+            return True
+        recent = (
+            Post.objects.filter(user=author, visibility="public")
+            .order_by("-created_at", "-id")
+            .values_list("id", "created_at")[: settings.FEED_BACKFILL_POSTS]
+        )
+        TimelineEntry.objects.bulk_create(
+            [TimelineEntry(user=follower, post_id=post_id, created_at=created_at) for post_id, created_at in recent],
+            ignore_conflicts=True,
+        )
+    return True
+
+
+def unfollow(follower, followee):
+    """Return False when follower did not follow followee."""
+    with transaction.atomic():
+        deleted, _ = Follow.objects.filter(follower=follower, followee=followee).delete()
+        if not deleted:
+            return False
+        CustomUser.objects.filter(pk=followee.pk).update(follower_count=F("follower_count") - 1)
+        TimelineEntry.objects.filter(user=follower, post__user=followee).delete()
+    return True
+
+
+def user_deleted(user):
+    """Drop user from the follower counts of the accounts it follows; its Follow rows go with it."""
+    followees = Follow.objects.filter(follower=user).values("followee_id")
+    CustomUser.objects.filter(pk__in=followees).update(follower_count=F("follower_count") - 1)
+
+
+def fan_out(post):
+    """Copy post into its author's timeline and, when public, into the followers' ones."""
+    entries = [TimelineEntry(user_id=post.user_id, post_id=post.pk, created_at=post.created_at)]
+    TimelineEntry.objects.bulk_create(entries, ignore_conflicts=True)
+    if post.visibility != "public":
+        return
+    # the followers of a feed_pull author all have pull=True: nothing to copy
+    followers = Follow.objects.filter(followee_id=post.user_id, pull=False).values_list("follower_id", flat=True)
+    last_id = 0
+    while batch := list(followers.filter(follower_id__gt=last_id).order_by("follower_id")[:BATCH_SIZE]):
+        TimelineEntry.objects.bulk_create(
+            [TimelineEntry(user_id=user_id, post_id=post.pk, created_at=post.created_at) for user_id in batch],
+            ignore_conflicts=True,
+        )
+        last_id = batch[-1]
+
+
+def post_saved(post, created):
+    loaded = post._loaded_values
+    if created:
+        fan_out(post)
+        return
+    if loaded.get("visibility") != post.visibility:
+        if post.visibility == "public":
+            fan_out(post)
+        else:
+            # made private: only the author may still see it
+            TimelineEntry.objects.filter(post=post).exclude(user_id=post.user_id).delete()
+    if loaded.get("created_at") != post.created_at:
+        TimelineEntry.objects.filter(post=post).update(created_at=post.created_at)
+
+
+def feed_page(viewer, per_page, after=None, before=None):
+    """
+    A KeysetPage of posts for viewer's feed, newest first. The cursors are
+    those of a ("-created_at", "-id") post listing; raises InvalidCursor.
+    """
+    paginator = KeysetPaginator(Post.objects.none(), per_page)
+    entries = KeysetPaginator(
+        TimelineEntry.objects.filter(user=viewer)
+        # entries are removed when a post turns private; this covers a
+        # fan-out racing with that change
+        .filter(Q(post__visibility="public") | Q(post__user=viewer))
+        .select_related("post__user")
+        .defer("post__content", "post__search_vector", "post__user__bio"),
+        per_page,
+        ("-created_at", "-post_id"),
+    )
+    pulled_authors = list(Follow.objects.filter(follower=viewer, pull=True).values_list("followee_id", flat=True))
+    sources = [(entries, lambda entry: entry.post)]
+    if pulled_authors:
+        sources.append((KeysetPaginator(Post.objects.for_listing().filter(user_id__in=pulled_authors), per_page), None))
+
+    rows = {}
+    for source, to_post in sources:
+        # each source returns its own per_page + 1 rows past the cursor;
+        # the first per_page + 1 of their union are the page's
+        queryset = source.before_queryset(before) if before else source.after_queryset(after)
+        for row in queryset:
+            post = to_post(row) if to_post else row
+            rows[post.pk] = post
+    rows = sorted(rows.values(), key=lambda post: (post.created_at, post.pk), reverse=not before)
+    return paginator.make_page(rows[: per_page + 1], after, before)
@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+import threading
+
+CARD_TEMPLATE = "posts_app/post_card.html"
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+
+def card_cache():
+    return caches[settings.POST_CARD_CACHE_ALIAS]
+
+
+def card_key(post_id, updated_at):
+    # updated_at is part of the key, so an edited post never serves a stale card
+    return f"post_card:{post_id}:{updated_at.timestamp():.6f}"
+
+
+def render_cards(posts):
+    """Render the post cards for a listing with one get_many/set_many round trip."""
+    cache = card_cache()
+    keyed = [(card_key(post.pk, post.updated_at), post) for post in posts]
+    cached = cache.get_many([key for key, _ in keyed])
+    rendered = {}
+    fragments = []
+    for key, post in keyed:
+        fragment = cached.get(key)
+        if fragment is None:
+            fragment = rendered[key] = render_to_string(CARD_TEMPLATE, {"post": post})
+        fragments.append(fragment)
+    if rendered:
+        cache.set_many(rendered)
+    with _stats_lock:
+        _stats["hits"] += len(keyed) - len(rendered)
+        _stats["misses"] += len(rendered)
+    return mark_safe("".join(fragments))
+
+
+def invalidate_card(post_id, updated_at):
+    if updated_at is not None:
+        card_cache().delete(card_key(post_id, updated_at))
+
+
+def card_cache_stats():
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,106 @@
+from datetime import timedelta
+from io import BytesIO
+from pathlib import PurePosixPath
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+from .models import ImageProcessingJob, Post
+import logging
+
+logger = logging.getLogger("posts_app")
+
+MAX_ATTEMPTS = 3
+# seconds before the first retry of a failed job, doubled for each further one
+RETRY_DELAY = 60
+ORIENTATION_TAG = 0x0112
+
+
+def build_variants(post):
+    """
+    Write one aspect-preserving WebP per size in settings.POST_IMAGE_SIZES and
+    return (width, height, variants) for the original upload.
+    """
+    sizes = sorted(settings.POST_IMAGE_SIZES, reverse=True)
+    stem = PurePosixPath(post.image.name).stem
+    with default_storage.open(post.image.name) as upload:
+        img = Image.open(upload)
+        width, height = img.size
+        if img.getexif().get(ORIENTATION_TAG) in (5, 6, 7, 8):
+            width, height = height, width
+        # JPEG can decode straight at 1/2, 1/4 or 1/8 scale, far cheaper
+        # than decoding full resolution and throwing pixels away
+        img.draft("RGB", (sizes[0], sizes[0]))
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "transparency" in img.info or img.mode in ("LA", "PA") else "RGB")
+
+        # never upscale: small uploads get a single variant at their own size
+        longest = max(img.size)
+        targets = sorted({min(size, longest) for size in sizes}, reverse=True)
+        variants = []
+        # each size is scaled down from the previous (larger) one
+        for size in targets:
+            img.thumbnail((size, size), Image.LANCZOS)
+            buffer = BytesIO()
+            img.save(buffer, "WEBP", quality=settings.POST_IMAGE_WEBP_QUALITY, method=4)
+            name = default_storage.save(f"post_image/variants/{stem}_{size}.webp", ContentFile(buffer.getvalue()))
+            variants.append({"name": name, "width": img.width, "height": img.height})
+    variants.reverse()
+    return width, height, variants
+
+
+def process_job(job):
+    post = job.post
+    if not post.image:
+        job.status = "done"
+        return
+    width, height, variants = build_variants(post)
+    # update() so the worker never re-enters Post.save(); the image filter
+    # drops results for an upload that was replaced in the meantime
+    updated = Post.objects.filter(pk=post.pk, image=post.image.name).update(
+        image_width=width, image_height=height, image_variants=variants, updated_at=timezone.now()
+    )
+    if not updated:
+        for variant in variants:
+            default_storage.delete(variant["name"])
+    job.status = "done"
+
+
+def process_next_job():
+    """Claim and process one pending job. Returns False when the queue is empty."""
+    with transaction.atomic():
+        job = (
+            ImageProcessingJob.objects.select_for_update(skip_locked=True, of=("self",))
+            .select_related("post")
+            .filter(status="pending", run_after__lte=timezone.now())
+            .order_by("run_after")
+            .first()
+        )
+        if job is None:
+            return False
+        job.attempts += 1
+        try:
+            with transaction.atomic():
+                process_job(job)
+        except Exception as error:
+            logger.exception(f"image job {job.pk} failed")
+            job.error = str(error)
+            if job.attempts >= MAX_ATTEMPTS:
+                job.status = "failed"
+            else:
+                # a failing job waits its turn instead of being picked again at once
+                job.run_after = timezone.now() + timedelta(seconds=RETRY_DELAY * 2 ** (job.attempts - 1))
+        job.save(update_fields=["status", "attempts", "error", "run_after"])
+    return True
+
+
+def process_pending_jobs(limit=None):
+    processed = 0
+    while limit is None or processed < limit:
+        if not process_next_job():
+            break
+        processed += 1
+    return processed
@@ -0,0 +1,201 @@
+"""
+Logging that stays out of the request path.
+
+Loggers write to an AsyncQueueHandler, which only puts the record on an
+in-memory queue. A listener thread per queue hands the records to the real
+handlers (named in the handler's `handlers` option) in batches, and the
+buffered file handler writes once per batch instead of once per record.
+The real handlers are attached to the TARGETS_LOGGER logger, which nothing
+logs to; start_listeners() takes them from there. Listeners are started
+from PostsAppConfig.ready(), restarted in forked workers and drained at exit.
+"""
+import atexit
+import contextvars
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import zlib
+
+request_id = contextvars.ContextVar("request_id", default="-")
+
+TARGETS_LOGGER = "posts_app.log_targets"
+
+_queue_handlers = []
+_listeners = []
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id.get()
+        return True
+
+
+class SampleInfoFilter(logging.Filter):
+    """
+    Keeps `rate` of the INFO and DEBUG records; warnings and errors always
+    pass. The choice is made per request id, so a sampled request keeps all
+    its lines.
+    """
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = float(rate)
+
+    def filter(self, record):
+        if self.rate >= 1 or record.levelno > logging.INFO:
+            return True
+        current = getattr(record, "request_id", request_id.get())
+        if current == "-":
+            return random.random() < self.rate
+        return zlib.crc32(current.encode()) / 2**32 < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class BufferedFileHandler(logging.FileHandler):
+    """
+    Append-only FileHandler that writes a whole batch with one write() when
+    the batching listener flushes. Every gunicorn worker appends to the same
+    file: with O_APPEND each write lands whole at the end, where a rotation
+    done by one worker would lose or clobber the others' records. Rotate
+    with an external logrotate (copytruncate).
+    """
+
+    def __init__(self, filename, encoding="utf-8"):
+        super().__init__(filename, mode="a", encoding=encoding, delay=True)
+        self.pending = []
+
+    def emit(self, record):
+        try:
+            self.pending.append(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        self.acquire()
+        try:
+            if not self.pending:
+                return
+            data = "".join(self.pending).encode(self.encoding)
+            self.pending = []
+            if self.stream is None:
+                self.stream = self._open()
+            fd = self.stream.fileno()
+            while data:
+                data = data[os.write(fd, data):]
+        except Exception:
+            self.handleError(None)
+        finally:
+            self.release()
+
+    def close(self):
+        self.flush()
+        super().close()
+
+
+class BatchingQueueListener(logging.handlers.QueueListener):
+    def __init__(self, queue, *handlers, batch_size=500):
+        super().__init__(queue, *handlers, respect_handler_level=True)
+        self.batch_size = batch_size
+
+    def _monitor(self):
+        while True:
+            batch = [self.dequeue(True)]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.dequeue(False))
+                except queue.Empty:
+                    break
+            for record in batch:
+                if record is self._sentinel:
+                    self.flush()
+                    return
+                self.handle(record)
+            self.flush()
+
+    def flush(self):
+        for handler in self.handlers:
+            handler.flush()
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue front for the handlers named in `handlers`, e.g. in LOGGING:
+    {"()": "posts_app.log_handlers.AsyncQueueHandler", "handlers": ["console", "file"]}
+    with "console" and "file" attached to the TARGETS_LOGGER logger.
+    """
+
+    def __init__(self, handlers=(), batch_size=500):
+        super().__init__(queue.SimpleQueue())
+        # resolved by start_listeners(), once every handler is configured
+        self.handler_names = list(handlers)
+        self.batch_size = batch_size
+        _queue_handlers.append(self)
+
+    def prepare(self, record):
+        # format message and traceback in the calling thread, where the args
+        # and the exception are still alive; keep the traceback apart from
+        # the message so the JSON formatter can give it its own key
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def start_listeners():
+    if _listeners:
+        return
+    configured = {target.name: target for target in logging.getLogger(TARGETS_LOGGER).handlers}
+    for handler in _queue_handlers:
+        missing = [name for name in handler.handler_names if name not in configured]
+        if missing:
+            raise ValueError(f"Handlers {', '.join(missing)} are not attached to the {TARGETS_LOGGER!r} logger")
+        targets = [configured[name] for name in handler.handler_names]
+        listener = BatchingQueueListener(handler.queue, *targets, batch_size=handler.batch_size)
+        listener.start()
+        _listeners.append(listener)
+
+
+def stop_listeners():
+    while _listeners:
+        _listeners.pop().stop()
+
+
+def _restart_in_child():
+    # the listener threads do not survive fork(); give the child fresh
+    # queues so it never touches a queue lock held at fork time
+    if not _listeners:
+        return
+    _listeners.clear()
+    for handler in _queue_handlers:
+        handler.queue = queue.SimpleQueue()
+    start_listeners()
+
+
+atexit.register(stop_listeners)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_in_child)
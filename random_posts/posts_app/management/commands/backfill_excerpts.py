@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from posts_app.excerpts import backfill_excerpts
+from posts_app.fragment_cache import card_cache,card_key
+from posts_app.models import Post
+from posts_app.page_cache import purge
+import time
+
+
+class Command(BaseCommand):
+    help = "fill in the listing excerpt of the posts that have none (bulk loads, older exports), in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size",type=int,default=2000)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        filled = 0
+        for batch in backfill_excerpts(Post,options["batch_size"]):
+            # the raw UPDATE skips save() and auto_now, so updated_at (and the card
+            # key built from it) stays the same: drop the cards rendered without the excerpt
+            card_cache().delete_many([card_key(post.pk,post.updated_at) for post in batch])
+            filled += len(batch)
+            self.stdout.write(f"{filled} excerpts filled")
+        if filled:
+            purge("posts")
+        self.stdout.write(self.style.SUCCESS(f"Filled {filled} excerpts in {time.perf_counter()-start:.1f}s"))
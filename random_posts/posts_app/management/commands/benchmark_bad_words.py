@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from posts_app.bad_words import BadWordMatcher
+import random
+import string
+import time
+
+
+def naive_search(words, text):
+    # the validator before posts_app.bad_words: one substring scan per word
+    lowered = text.lower()
+    return any([word in lowered for word in words])
+
+
+class Command(BaseCommand):
+    help = "time the compiled bad word matcher against one scan per word as the word list grows"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes",type=int,nargs="+",default=[10,100,1_000,10_000,50_000],help="word list sizes")
+        parser.add_argument("--text-length",type=int,default=5_000,help="characters per scanned text")
+        parser.add_argument("--repeat",type=int,default=20)
+        parser.add_argument("--whole-words",action="store_true")
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        def word():
+            return "".join(rng.choices(string.ascii_lowercase,k=rng.randint(4,10)))
+        # clean text, the common case and the worst one: every position is tried
+        text = " ".join(word() for _ in range(options["text_length"]//7))[:options["text_length"]].replace("q","")
+        self.stdout.write(f"{'words':>8} {'compile ms':>11} {'compiled ns/char':>17} {'naive ns/char':>14}")
+        for size in options["sizes"]:
+            # q never appears in the text: no word matches, but their
+            # prefixes do, so the engine still walks into the trie
+            words = [word()+"q" for _ in range(size)]
+            start = time.perf_counter()
+            matcher = BadWordMatcher(words,whole_words=options["whole_words"])
+            compile_ms = (time.perf_counter()-start)*1000
+            compiled = self.per_char(lambda: matcher.search(text),len(text),options["repeat"])
+            naive = self.per_char(lambda: naive_search(words,text),len(text),max(options["repeat"]//10,1))
+            self.stdout.write(f"{size:>8} {compile_ms:>11.1f} {compiled:>17.1f} {naive:>14.1f}")
+
+    def per_char(self, func, length, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter_ns()
+            func()
+            timings.append(time.perf_counter_ns()-start)
+        return min(timings)/length
@@ -0,0 +1,161 @@
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+from django.test import RequestFactory
+from django.utils.timezone import now
+from posts_app.models import CustomUser,Post,PostRollup
+from posts_app import rollups
+from posts_app.excerpts import backfill_excerpts
+from posts_app.pagination import KeysetPaginator
+from posts_app.search import search_posts
+from posts_app.views import PostSearchView,PostsListView,UserPostsView,UsersListView
+from contextlib import contextmanager
+from datetime import timedelta
+import asyncio
+import random
+import statistics
+import time
+
+
+async def wait(coroutine):
+    return await coroutine
+
+
+def render_view(view_class, request, **kwargs):
+    response = view_class.as_view()(request, **kwargs)
+    if asyncio.iscoroutine(response):
+        # the async read views return a rendered response
+        return async_to_sync(wait)(response)
+    return response.render()
+
+
+class Command(BaseCommand):
+    help = "seed posts and report EXPLAIN plans and latency of the listing queries and views"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts",type=int,default=1_000_000,help="seed until this many posts exist")
+        parser.add_argument("--users",type=int,default=10_000,help="seed until this many benchmark users exist")
+        parser.add_argument("--batch-size",type=int,default=10_000)
+        parser.add_argument("--repeat",type=int,default=20,help="timed runs per scenario")
+        parser.add_argument("--compare",action="store_true",help="also run every scenario with the Post/CustomUser indexes dropped")
+        parser.add_argument("--no-explain",action="store_true")
+
+    def handle(self, *args, **options):
+        self.seed(options["users"],options["posts"],options["batch_size"])
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute(f"ANALYZE {Post._meta.db_table}")
+                cursor.execute(f"ANALYZE {CustomUser._meta.db_table}")
+
+        if options["compare"]:
+            self.stdout.write(self.style.MIGRATE_HEADING("Without indexes"))
+            with self.indexes_dropped():
+                self.run_scenarios(options)
+            self.stdout.write(self.style.MIGRATE_HEADING("With indexes"))
+        self.run_scenarios(options)
+
+    def seed(self, users, posts, batch_size):
+        existing = CustomUser.objects.filter(username__startswith="bench_user").count()
+        for start in range(existing,users,batch_size):
+            CustomUser.objects.bulk_create([
+                # "!" is an unusable password hash, bulk_create skips CustomUser.save
+                CustomUser(username=f"bench_user{i}",email=f"bench_user{i}@example.com",password="!",
+                           date_joined=now()-timedelta(days=random.randint(0,365)))
+                for i in range(start,min(start+batch_size,users))
+            ])
+        user_ids = list(CustomUser.objects.values_list("id",flat=True))
+        missing = posts - Post.objects.count()
+        while missing > 0:
+            size = min(batch_size,missing)
+            Post.objects.bulk_create([
+                Post(user_id=random.choice(user_ids),
+                     # ~0.1% of the posts share a topic word, for the selective search
+                     content=f"Benchmark post content that is long enough to be valid, topic{random.randint(0,999)}",
+                     categories="benchmark",
+                     visibility=random.choice(["public","private"]),
+                     created_at=now()-timedelta(seconds=random.randint(0,365*24*3600)))
+                for _ in range(size)
+            ])
+            missing -= size
+            self.stdout.write(f"seeded posts, {max(missing,0)} to go")
+        # bulk_create skips Post.save, which sets the excerpt
+        for _ in backfill_excerpts(Post,batch_size):
+            pass
+
+    @contextmanager
+    def indexes_dropped(self):
+        with connection.schema_editor() as editor:
+            for model in (Post,CustomUser):
+                for index in model._meta.indexes:
+                    editor.remove_index(model,index)
+        try:
+            yield
+        finally:
+            with connection.schema_editor() as editor:
+                for model in (Post,CustomUser):
+                    for index in model._meta.indexes:
+                        editor.add_index(model,index)
+            self.stdout.write("indexes restored")
+
+    def scenarios(self):
+        rollups.catch_up()
+        factory = RequestFactory()
+        top_author = CustomUser.objects.annotate(posts=Count("user_posts")).order_by("-posts").first()
+        listing = Post.objects.for_listing()
+        paginator = KeysetPaginator(listing,20)
+        deep_post = listing.order_by("-created_at","-id")[Post.objects.count()*9//10]
+        deep_cursor = paginator.cursor_for(deep_post)
+        start_of_month = now().replace(day=1,hour=0,minute=0,second=0,microsecond=0)
+
+        return [
+            ("posts-list page 1",
+             listing.order_by("-created_at","-id")[:21],
+             lambda: render_view(PostsListView,factory.get("/posts/"))),
+            ("posts-list page at 90%",
+             listing.filter(paginator.seek_filter(paginator.decode(deep_cursor))).order_by("-created_at","-id")[:21],
+             lambda: render_view(PostsListView,factory.get("/posts/",{"after":deep_cursor}))),
+            ("user-posts page 1",
+             Post.objects.for_listing(author=top_author).order_by("-created_at","-id")[:21],
+             lambda: render_view(UserPostsView,factory.get("/"),username=top_author.username)),
+            ("own user-posts page 1",
+             Post.objects.for_listing(top_author,author=top_author).order_by("-created_at","-id")[:21],
+             None),
+            ("users-list",
+             UsersListView.queryset,
+             lambda: render_view(UsersListView,factory.get("/users/"))),
+            ("search common term page 1",
+             search_posts(listing,"benchmark").order_by("-rank","-id")[:21],
+             lambda: render_view(PostSearchView,factory.get("/posts/search/",{"q":"benchmark"}))),
+            ("search selective term page 1",
+             search_posts(listing,"topic417").order_by("-rank","-id")[:21],
+             lambda: render_view(PostSearchView,factory.get("/posts/search/",{"q":"topic417"}))),
+            ("get_stats posts this month",
+             Post.objects.filter(created_at__gte=start_of_month),
+             lambda: Post.objects.filter(created_at__gte=start_of_month).count()),
+            ("get_stats users this month",
+             CustomUser.objects.filter(date_joined__gte=start_of_month),
+             lambda: CustomUser.objects.filter(date_joined__gte=start_of_month).count()),
+            ("get_stats from rollups",
+             PostRollup.objects.filter(day__gte=start_of_month.date()),
+             lambda: (rollups.summarize(start_of_month.date(),by_category=True),rollups.top_poster())),
+        ]
+
+    def run_scenarios(self, options):
+        for name,queryset,view in self.scenarios():
+            self.stdout.write(self.style.SUCCESS(name))
+            if not options["no_explain"]:
+                self.stdout.write(queryset.explain())
+            query_ms = self.measure(lambda: list(queryset.all()),options["repeat"])
+            self.stdout.write(f"  query  p50 {statistics.median(query_ms):.2f} ms  max {max(query_ms):.2f} ms")
+            if view is not None:
+                view_ms = self.measure(view,options["repeat"])
+                self.stdout.write(f"  call   p50 {statistics.median(view_ms):.2f} ms  max {max(view_ms):.2f} ms")
+
+    def measure(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter()-start)*1000)
+        return timings
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from posts_app.bulk_io import MODELS, export_rows
+import sys
+import time
+
+
+class Command(BaseCommand):
+    help = "stream posts or users to a CSV / JSON-lines file (COPY on PostgreSQL)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("model",choices=sorted(MODELS))
+        parser.add_argument("path",help="output file, - for stdout")
+        parser.add_argument("--format",choices=["csv","jsonl"],help="defaults to the file extension")
+        parser.add_argument("--chunk-size",type=int,default=2000,help="rows fetched per round trip on the ORM path")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or ("jsonl" if path.endswith((".jsonl",".json")) else "csv")
+        start = time.perf_counter()
+        if path == "-":
+            count = export_rows(MODELS[options["model"]],sys.stdout,file_format,options["chunk_size"])
+        else:
+            with open(path,"w",newline="",encoding="utf-8") as output:
+                count = export_rows(MODELS[options["model"]],output,file_format,options["chunk_size"])
+        elapsed = time.perf_counter() - start
+        # keep stdout clean for the data when exporting to -
+        self.stderr.write(self.style.SUCCESS(
+            f"Exported {count} {options['model']} in {elapsed:.1f}s ({count/elapsed if elapsed else 0:,.0f} rows/s)"
+        ))
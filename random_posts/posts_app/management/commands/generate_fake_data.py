@@ -1,43 +1,143 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.hashers import make_password
+from django.db import connections
 from django.utils.crypto import get_random_string
 from posts_app.models import CustomUser,Post
+from posts_app.categories import link_new_posts
+from posts_app.excerpts import make_excerpt
+from posts_app.page_cache import purge
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from collections import deque
+import os
 import random
+import time
 import faker
 
+
+def fake_users(seed, start, count, run_id):
+    """Runs in a worker process: build plain tuples, the parent does the INSERTs."""
+    fake = faker.Faker()
+    fake.seed_instance(seed)
+    rng = random.Random(seed)
+    rows = []
+    for index in range(start, start + count):
+        username = f"fake_user{run_id}{index}_{fake.user_name()}"
+        rows.append((
+            username,
+            fake.first_name(),
+            f"{username}@{fake.free_email_domain()}",
+            fake.phone_number(),
+            rng.randint(18, 70),
+            fake.text(max_nb_chars=50),
+            rng.choice(['M', 'F']),
+        ))
+    return rows
+
+
+def fake_posts(seed, count, days):
+    fake = faker.Faker()
+    fake.seed_instance(seed)
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    # Faker costs ~200us per text; recombining a per-task pool of sentences
+    # keeps the content varied at a fraction of the cost
+    sentences = [fake.sentence() for _ in range(min(count, 500))]
+    words = [fake.word() for _ in range(min(count, 200))]
+    rows = []
+    for _ in range(count):
+        content = " ".join(rng.sample(sentences, min(len(sentences), rng.randint(2, 5))))
+        rows.append((
+            content[:200],
+            rng.choice(words),
+            rng.choice(['public','private']),
+            now - timedelta(seconds=rng.randint(0, days * 24 * 3600)),
+        ))
+    return rows
+
+
 class Command(BaseCommand):
-    help = "generate 100 fake user and 100 fake post"
-
-    def handle(self, *args, **kwargs):
-
-        fake = faker.Faker()
-        for _ in range(100):
-            username = "fake_user"+fake.user_name()
-            first_name = fake.first_name()
-            email = fake.email()
-            phone_number = fake.phone_number()
-            age = random.randint(18, 70)  # Random age between 18 and 70
-            bio = fake.text(max_nb_chars=50)
-            sex = random.choice(['M', 'F'])
-
-            CustomUser.objects.create(
-                username=username,
-                email=email,
-                first_name=first_name,
-                phone_number=phone_number,
-                age=age,
-                sex=sex,
-                password=get_random_string(length=15)  )
-            self.stdout.write(self.style.SUCCESS(f'Created user: {username}'))
-        
-        for _ in range(100):
-            user = CustomUser.objects.filter(username__startswith="fake_user").order_by("?").first()
-            content = fake.text(max_nb_chars=200)
-            categories = fake.word()
-            visibility = random.choice(['public','private'])
-            Post.objects.create(
-                user=user,
-                content=content,
-                categories = categories,
-                visibility=visibility
+    help = "generate fake users and posts in bulk (100 of each by default)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users",type=int,default=100)
+        parser.add_argument("--posts",type=int,default=100)
+        parser.add_argument("--batch-size",type=int,default=5000,help="rows per INSERT and per worker task")
+        parser.add_argument("--workers",type=int,default=os.cpu_count() or 1,help="processes generating rows")
+        parser.add_argument("--days",type=int,default=365,help="spread created_at over this many past days")
+        parser.add_argument("--password",help="give every fake user this password (hashed once); unusable by default")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        workers = max(options["workers"],1)
+        # hashing is deliberately slow (1M PBKDF2 rounds), so do it once for all users
+        password = make_password(options["password"])
+        run_id = get_random_string(6).lower()
+
+        # forked workers must not share the parent's database socket
+        connections.close_all()
+        executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        try:
+            start = time.perf_counter()
+            tasks = (
+                (fake_users, (random.getrandbits(32), offset, min(batch_size, options["users"] - offset), run_id))
+                for offset in range(0, options["users"], batch_size)
+            )
+            created = 0
+            for rows in self.generate(executor, tasks, workers):
+                CustomUser.objects.bulk_create([
+                    CustomUser(username=username,first_name=first_name,email=email,phone_number=phone_number,
+                               age=age,bio=bio,sex=sex,password=password)
+                    for username,first_name,email,phone_number,age,bio,sex in rows
+                ],batch_size=batch_size)
+                created += len(rows)
+            self.report("users",created,start)
+
+            author_ids = list(CustomUser.objects.filter(username__startswith="fake_user").values_list("id",flat=True))
+            if options["posts"] and not author_ids:
+                raise CommandError("No fake users to author the posts, run with --users first")
+
+            start = time.perf_counter()
+            tasks = (
+                (fake_posts, (random.getrandbits(32), min(batch_size, options["posts"] - offset), options["days"]))
+                for offset in range(0, options["posts"], batch_size)
             )
+            created = 0
+            for rows in self.generate(executor, tasks, workers):
+                Post.objects.bulk_create([
+                    Post(user_id=random.choice(author_ids),content=content,excerpt=make_excerpt(content),
+                         categories=categories,visibility=visibility,created_at=created_at)
+                    for content,categories,visibility,created_at in rows
+                ],batch_size=batch_size)
+                created += len(rows)
+                self.stdout.write(f"{created} posts created")
+            self.report("posts",created,start)
+            # bulk_create skips the signal that links posts to their categories
+            start = time.perf_counter()
+            linked = link_new_posts(batch_size)
+            self.stdout.write(f"Linked {linked} posts to their categories in {time.perf_counter()-start:.1f}s")
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        # bulk_create sends no signals, so purge the cached pages explicitly
+        purge("posts","users")
+
+    def generate(self, executor, tasks, workers):
+        """Yield task results in order, keeping at most 2 tasks per worker in flight."""
+        if executor is None:
+            for func, args in tasks:
+                yield func(*args)
+            return
+        pending = deque()
+        for func, args in tasks:
+            pending.append(executor.submit(func, *args))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
 
+    def report(self, label, count, start):
+        elapsed = time.perf_counter() - start
+        rate = count / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(f"Created {count} {label} in {elapsed:.1f}s ({rate:,.0f} rows/s)"))
@@ -1,26 +1,42 @@
-from django.core.management.base import BaseCommand
-from posts_app.models import CustomUser,Post
-from django.utils.timezone import now
-from django.db.models import Count
+from django.core.management.base import BaseCommand, CommandError
+from posts_app import rollups
+from posts_app.routers import use_replica
+from django.utils.timezone import localdate
+from datetime import date
 class Command(BaseCommand):
-    help = "get the stats created this month"
+    help = "get the stats created this month, or between --since and --until, from the daily rollups"
 
+    def add_arguments(self, parser):
+        parser.add_argument("--since",type=date.fromisoformat,help="first day (YYYY-MM-DD), defaults to the start of the month")
+        parser.add_argument("--until",type=date.fromisoformat,help="last day (YYYY-MM-DD), inclusive")
+        parser.add_argument("--by-category",action="store_true",help="also break the posts down per category")
+        parser.add_argument("--rebuild",action="store_true",help="recount the rollups from scratch")
 
     def handle(self, *args, **options):
 
-        today = now()
+        today = localdate()
         self.stdout.write(str(today))
-        start_of_month = today.replace(day=1)
-        self.stdout.write(str(start_of_month))
+        since = options["since"]
+        until = options["until"]
+        if since is None and until is None:
+            since = today.replace(day=1)
+        if since and until and since > until:
+            raise CommandError("--since must not be after --until")
+        this_month = options["since"] is None and until is None
+        period = "this month" if this_month else f"from {since or 'the start'} to {until or 'today'}"
 
-        user_count = CustomUser.objects.filter(date_joined__gte=start_of_month).count()
-        post_count =Post.objects.filter(created_at__gte=start_of_month).count()
-        user_with_highest_posts = (
-            CustomUser.objects.annotate(posts=Count('user_posts'))  
-            .order_by('-posts')
-            .first()
-        )
-        self.stdout.write(self.style.SUCCESS(f"Users registered this month {user_count}"))
-        self.stdout.write(self.style.SUCCESS(f"Posts created this month {post_count}"))
-        self.stdout.write(self.style.NOTICE(f"User with highest number of posts {user_with_highest_posts.username}"))
-        
\ No newline at end of file
+        # counts rows added since the last run (or by bulk loads), usually a handful
+        counted = rollups.rebuild() if options["rebuild"] else rollups.catch_up()
+        self.stdout.write(f"Counted {counted['users']} new users and {counted['posts']} new posts into the rollups")
+
+        # the reads go to a replica, unless the rollups just changed and the
+        # replica may not have the new counts yet
+        with use_replica("default" if counted["users"] or counted["posts"] else None):
+            summary = rollups.summarize(since,until,by_category=options["by_category"])
+            # the monthly report ranks posters over all time, a range ranks within it
+            top_poster = rollups.top_poster() if this_month else rollups.top_poster(since,until)
+        self.stdout.write(self.style.SUCCESS(f"Users registered {period} {summary['signups']}"))
+        self.stdout.write(self.style.SUCCESS(f"Posts created {period} {summary['posts']}"))
+        self.stdout.write(self.style.NOTICE(f"User with highest number of posts {top_poster.username if top_poster else '-'}"))
+        for category,total in summary.get("categories",[]):
+            self.stdout.write(f"  {category}: {total}")
@@ -0,0 +1,82 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from posts_app.categories import link_new_posts
+from posts_app.excerpts import backfill_excerpts
+from posts_app.models import Post
+from posts_app.bulk_io import MODELS, read_rows, reset_sequences, validate_batch, write_batch
+from posts_app.page_cache import purge
+from posts_app.rollups import ROLLUPS
+from itertools import islice
+import sys
+import time
+
+
+class Command(BaseCommand):
+    help = "load posts or users from a CSV / JSON-lines export (COPY on PostgreSQL)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("model",choices=sorted(MODELS))
+        parser.add_argument("path",help="input file, - for stdin")
+        parser.add_argument("--format",choices=["csv","jsonl"],help="defaults to the file extension")
+        parser.add_argument("--batch-size",type=int,default=5000)
+        parser.add_argument("--strict",action="store_true",help="abort on the first invalid row instead of skipping it")
+        parser.add_argument("--no-validate",action="store_true",help="load rows without running the model validators")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or ("jsonl" if path.endswith((".jsonl",".json")) else "csv")
+        model = MODELS[options["model"]]
+        source = sys.stdin if path == "-" else open(path,newline="",encoding="utf-8")
+        imported = skipped = 0
+        lowest_id = None
+        start = time.perf_counter()
+        try:
+            rows = read_rows(model,source,file_format)
+            offset = 0
+            while read := list(islice(rows,options["batch_size"])):
+                batch = [row for row,_ in read]
+                errors = {index:messages for index,(_,messages) in enumerate(read) if messages}
+                if not options["no_validate"]:
+                    readable = [index for index in range(len(batch)) if index not in errors]
+                    found = validate_batch(model,[batch[index] for index in readable]) if readable else {}
+                    errors.update({readable[index]:messages for index,messages in found.items()})
+                if errors and options["strict"]:
+                    index, messages = min(errors.items())
+                    raise CommandError(f"Row {offset+index+1}: {', '.join(messages)}")
+                for index, messages in sorted(errors.items())[:10]:
+                    self.stderr.write(f"Skipping row {offset+index+1}: {', '.join(messages)}")
+                valid = [row for index,row in enumerate(batch) if index not in errors]
+                write_batch(model,valid)
+                ids = [row[model._meta.pk.attname] for row in valid if row.get(model._meta.pk.attname) is not None]
+                if ids:
+                    lowest_id = min(ids + ([lowest_id] if lowest_id is not None else []))
+                imported += len(valid)
+                skipped += len(errors)
+                offset += len(batch)
+                elapsed = time.perf_counter() - start
+                self.stdout.write(f"{imported} rows imported ({imported/elapsed if elapsed else 0:,.0f} rows/s)")
+        except (ValueError, ValidationError) as error:
+            raise CommandError(f"Row {offset+1}: {error}")
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+        reset_sequences(model)
+        if options["model"] == "posts":
+            self.stdout.write(f"Linked {link_new_posts(options['batch_size'])} posts to their categories")
+            # exports written before the excerpt column existed have none
+            filled = sum(len(batch) for batch in backfill_excerpts(Post,options["batch_size"]))
+            if filled:
+                self.stdout.write(f"Filled {filled} excerpts")
+        # COPY and bulk_create send no signals
+        purge("posts","users")
+        rollup = ROLLUPS[options["model"]]
+        if lowest_id is not None and lowest_id <= rollup.watermark():
+            # catch_up() only looks past the watermark, so recount everything
+            self.stdout.write(f"Rebuilding the {options['model']} rollup")
+            rollup.rebuild()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {imported} {options['model']}, skipped {skipped}, in {elapsed:.1f}s "
+            f"({imported/elapsed if elapsed else 0:,.0f} rows/s)"
+        ))
@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand, CommandError
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+import itertools
+import re
+import statistics
+import time
+
+CONNECT = re.compile(r'db-connect;desc="(\d+) new connections"')
+DB = re.compile(r'db;dur=([\d.]+)')
+
+
+class Command(BaseCommand):
+    help = (
+        "send concurrent GETs to a running server and report latency and database connects per request; "
+        "run it once with DB_CONN_MAX_AGE=0 and once with persistent connections or DB_POOL=1 to compare"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url",default="http://127.0.0.1:8000",help="server base URL")
+        parser.add_argument("--paths",nargs="+",default=["/posts/","/users/"])
+        parser.add_argument("--requests",type=int,default=500,help="requests per path")
+        parser.add_argument("--concurrency",type=int,default=8)
+        parser.add_argument("--use-page-cache",action="store_true",
+                            help="let anonymous pages come from the page cache (by default each URL is unique)")
+
+    def handle(self, *args, **options):
+        base = options["url"].rstrip("/")
+        counter = itertools.count()
+        self.stdout.write(
+            f"{'path':<12} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'db ms':>7} {'connects/req':>13} {'errors':>7}"
+        )
+        for path in options["paths"]:
+            def fetch(_):
+                url = base + path
+                if not options["use_page_cache"]:
+                    url += ("&" if "?" in path else "?") + f"load_test={next(counter)}"
+                return self.fetch(url)
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+                results = list(executor.map(fetch, range(options["requests"])))
+            elapsed = time.perf_counter() - start
+            ok = [result for result in results if result is not None]
+            if not ok:
+                raise CommandError(f"Every request to {base + path} failed")
+            latencies = sorted(result[0] for result in ok)
+            quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+            self.stdout.write(
+                f"{path:<12} {len(results)/elapsed:>8.1f} {quantiles[49]:>8.1f} {quantiles[94]:>8.1f} {quantiles[98]:>8.1f} "
+                f"{statistics.mean(result[1] for result in ok):>7.2f} "
+                f"{statistics.mean(result[2] for result in ok):>13.2f} {len(results)-len(ok):>7}"
+            )
+
+    def fetch(self, url):
+        """Return (latency ms, db ms, new connections) from the Server-Timing header, or None on errors."""
+        start = time.perf_counter()
+        try:
+            with urlopen(Request(url, headers={"Accept": "text/html"}), timeout=30) as response:
+                response.read()
+                timing = response.headers.get("Server-Timing", "")
+        except (HTTPError, URLError, OSError):
+            return None
+        latency = (time.perf_counter() - start) * 1000
+        connects = CONNECT.search(timing)
+        db = DB.search(timing)
+        return latency, float(db.group(1)) if db else 0.0, int(connects.group(1)) if connects else 0
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from posts_app.images import process_pending_jobs
+import time
+
+
+class Command(BaseCommand):
+    help = "resize uploaded post images into WebP variants (runs as a background worker)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once",action="store_true",help="drain the queue and exit instead of polling")
+        parser.add_argument("--sleep",type=float,default=2.0,help="seconds to wait when the queue is empty")
+
+    def handle(self, *args, **options):
+        while True:
+            processed = process_pending_jobs()
+            if processed:
+                self.stdout.write(self.style.SUCCESS(f"Processed {processed} image(s)"))
+            if options["once"]:
+                break
+            time.sleep(options["sleep"])
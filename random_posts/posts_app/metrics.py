@@ -0,0 +1,243 @@
+"""
+In-process counters and histograms rendered in the Prometheus text format by
+the /metrics view.
+
+Every process keeps its own values: with several workers each scrape sees
+the worker that answered it, so scrape them individually or sum in the
+query.
+"""
+import bisect
+import math
+import threading
+
+# seconds; roughly x2.5 steps from 1ms to 10s
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(
+        '%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def set(self, *labels, value):
+        # for totals counted elsewhere and copied in by a collector
+        with self._lock:
+            self._values[labels] = value
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_labels(self.label_names, labels)} {_number(value)}" for labels, value in values
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+
+class Histogram(Metric):
+    """
+    Fixed buckets, so observe() is O(log buckets) and memory does not grow
+    with traffic. Quantiles are interpolated inside the bucket they fall in.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, *labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            state["counts"][index] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def snapshot(self, *labels):
+        with self._lock:
+            state = self._values.get(labels)
+            return None if state is None else {**state, "counts": list(state["counts"])}
+
+    def quantile(self, q, *labels):
+        state = self.snapshot(*labels)
+        if state is None or not state["count"]:
+            return None
+        rank = q * state["count"]
+        seen = 0
+        for index, count in enumerate(state["counts"]):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index else 0
+                upper = self.buckets[index]
+                if upper == math.inf:
+                    return lower
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-2]
+
+    def render(self):
+        with self._lock:
+            states = sorted(
+                ((labels, {**state, "counts": list(state["counts"])}) for labels, state in self._values.items()),
+                key=lambda item: item[0],
+            )
+        lines = self.header()
+        names = self.label_names + ("le",)
+        for labels, state in states:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state["counts"]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(names, labels + (_number(bound),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_number(state['sum'])}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {state['count']}")
+        # precomputed percentiles for dashboards without histogram_quantile()
+        lines.append(f"# HELP {self.name}_quantile {self.help_text} (interpolated quantiles)")
+        lines.append(f"# TYPE {self.name}_quantile gauge")
+        for labels, _ in states:
+            for q in QUANTILES:
+                value = self.quantile(q, *labels)
+                label = _labels(self.label_names + ("quantile",), labels + (q,))
+                lines.append(f"{self.name}_quantile{label} {_number(float(value))}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._get_or_create(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text, labels=()):
+        return self._get_or_create(Gauge, name, help_text, labels)
+
+    def histogram(self, name, help_text, labels=(), buckets=DURATION_BUCKETS):
+        return self._get_or_create(Histogram, name, help_text, labels, buckets)
+
+    def collector(self, func):
+        """Register func() to refresh gauges right before each render."""
+        self._collectors.append(func)
+        return func
+
+    def render(self):
+        for collect in self._collectors:
+            collect()
+        lines = []
+        for _, metric in sorted(self._metrics.items()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+request_duration = REGISTRY.histogram(
+    "http_request_duration_seconds", "Time spent answering a request", labels=("view", "method")
+)
+requests_total = REGISTRY.counter("http_requests_total", "Requests answered", labels=("view", "method", "status"))
+errors_total = REGISTRY.counter("http_errors_total", "Error pages served", labels=("status",))
+request_db_queries = REGISTRY.histogram(
+    "http_request_db_queries", "Database queries run by one request", labels=("view",), buckets=COUNT_BUCKETS
+)
+request_db_duration = REGISTRY.histogram(
+    "http_request_db_duration_seconds", "Time one request spent in database queries", labels=("view",)
+)
+rate_limited_total = REGISTRY.counter(
+    "http_rate_limited_total", "Requests refused with 429 by RateLimitMiddleWare", labels=("view", "key")
+)
+post_card_cache = REGISTRY.counter("post_card_cache_lookups_total", "Post card fragment cache lookups", labels=("result",))
+
+
+@REGISTRY.collector
+def collect_card_cache():
+    from .fragment_cache import card_cache_stats
+
+    for result, value in card_cache_stats().items():
+        post_card_cache.set(result, value=value)
+
+db_connections_opened = REGISTRY.counter(
+    "db_connections_opened_total", "Database connections opened by this process", labels=("database",)
+)
+db_pool_connections = REGISTRY.gauge(
+    "db_pool_connections", "Connections in this process's pool", labels=("database", "state")
+)
+db_pool_requests_waiting = REGISTRY.gauge(
+    "db_pool_requests_waiting", "Requests waiting for a pooled connection", labels=("database",)
+)
+db_pool_requests = REGISTRY.counter(
+    "db_pool_requests_total", "Connections handed out by this process's pool", labels=("database",)
+)
+db_pool_requests_queued = REGISTRY.counter(
+    "db_pool_requests_queued_total", "Pool requests that had to wait for a connection", labels=("database",)
+)
+db_pool_wait = REGISTRY.counter(
+    "db_pool_wait_seconds_total", "Time spent waiting for a pooled connection", labels=("database",)
+)
+
+
+@REGISTRY.collector
+def collect_db_pools():
+    from django.db import connections
+
+    for alias in connections:
+        connection = connections[alias]
+        if connection.vendor != "postgresql" or not connection.settings_dict["OPTIONS"].get("pool"):
+            continue
+        # psycopg_pool counters are totals since the pool opened
+        stats = connection.pool.get_stats()
+        db_connections_opened.set(alias, value=stats.get("connections_num", 0))
+        db_pool_connections.set(alias, "open", value=stats.get("pool_size", 0))
+        db_pool_connections.set(alias, "idle", value=stats.get("pool_available", 0))
+        db_pool_requests_waiting.set(alias, value=stats.get("requests_waiting", 0))
+        db_pool_requests.set(alias, value=stats.get("requests_num", 0))
+        db_pool_requests_queued.set(alias, value=stats.get("requests_queued", 0))
+        db_pool_wait.set(alias, value=stats.get("requests_wait_ms", 0) / 1000)
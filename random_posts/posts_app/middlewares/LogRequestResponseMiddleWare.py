@@ -1,25 +1,126 @@
-from django.shortcuts import redirect
-from django.http import Http404
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.template.loader import render_to_string
+from posts_app.log_handlers import request_id
+from posts_app.metrics import errors_total
 import logging
+import re
+import threading
+import uuid
 
 logger= logging.getLogger("posts_app")
+
+ERROR_TEMPLATE = "posts_app/error_page.html"
+ERROR_PAGES = {
+    400:("Bad Request","The request could not be understood. Check the address or the form and try again."),
+    401:("Unauthorized","You need to log in to see this page."),
+    403:("Forbidden","You are not allowed to do this."),
+    404:("Oops! Page Not Found","We can't seem to find the page you're looking for. It might have been removed, renamed, or is temporarily unavailable."),
+    500:("Something Went Wrong","The server ran into an error. Please try again in a moment."),
+}
+
+
+def error_context(status_code):
+    title, message = ERROR_PAGES.get(status_code, ERROR_PAGES[404])
+    return {"status_code":status_code,"title":title,"message":message}
+
+
+_rendered_lock = threading.Lock()
+_rendered = {}
+
+
+def render_error_page(request, status_code):
+    user = getattr(request,"user",None)
+    if user is not None and user.is_authenticated:
+        # the header shows the user's name
+        return render_to_string(ERROR_TEMPLATE,error_context(status_code),request)
+    # anonymous pages are identical, render each status once per process
+    content = _rendered.get(status_code)
+    if content is None:
+        content = render_to_string(ERROR_TEMPLATE,error_context(status_code),request)
+        with _rendered_lock:
+            _rendered[status_code] = content
+    return content
+
+
 class ErrorHandlingMiddleWare:
+    """Replaces the body of error responses with the error page, keeping the status code."""
+
+    sync_capable = True
+    async_capable = True
 
     def __init__(self,get_response):
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        
-
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
         response = self.get_response(request)
-        
+        if self.is_error_page(response):
+            self.replace_content(request,response)
+        return response
 
-        if response.status_code in (400,401,403, 404,500):
-            print("an error occured")
-            logger.warning(f"error page is called: status code {response.status_code},user {request.user}")
-            return redirect("error_page")
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if self.is_error_page(response):
+            # the page greets logged in users by name; load the user with
+            # the async API, a lazy request.user would query from the event loop
+            request.user = await request.auser()
+            self.replace_content(request,response)
+        return response
+
+    def is_error_page(self, response):
+        # the JSON API answers its errors in JSON
+        return (
+            response.status_code in ERROR_PAGES
+            and not response.streaming
+            and not response.get("Content-Type","").startswith("application/json")
+        )
+
+    def replace_content(self, request, response):
+        errors_total.inc(response.status_code)
+        logger.warning(f"error page is called: status code {response.status_code},user {getattr(request,'user',None)}")
+        # rendered in place: a redirect to /error/ cost a second request
+        # through the whole stack and answered errors with a 200
+        response.content = render_error_page(request,response.status_code)
+        response["Content-Type"] = "text/html; charset=utf-8"
+        if "Content-Length" in response:
+            del response["Content-Length"]
+
+
+class RequestIdMiddleWare:
+    """Tags the request's log records (and the response) with an X-Request-ID."""
+
+    header_pattern = re.compile(r"^[\w.-]{1,64}$")
+    sync_capable = True
+    async_capable = True
 
+    def __init__(self,get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        current = self.tag(request)
+        response = self.get_response(request)
+        response["X-Request-ID"] = current
+        return response
 
+    async def __acall__(self, request):
+        current = self.tag(request)
+        response = await self.get_response(request)
+        response["X-Request-ID"] = current
         return response
 
-        
+    def tag(self, request):
+        incoming = request.headers.get("X-Request-ID","")
+        # trust an id set by the proxy in front of us, if it looks like one
+        current = incoming if self.header_pattern.match(incoming) else uuid.uuid4().hex
+        # not reset afterwards: django.request logs the response after the
+        # middleware chain returns
+        request_id.set(current)
+        request.request_id = current
+        return current
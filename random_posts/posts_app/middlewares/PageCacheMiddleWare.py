@@ -0,0 +1,106 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.urls import Resolver404, resolve
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from posts_app.page_cache import atag_versions, page_cache, tag_versions
+import hashlib
+import time
+
+
+class AnonymousPageCacheMiddleWare:
+    """
+    Serves the views listed in settings.PAGE_CACHE_VIEWS to anonymous visitors
+    from the cache, and answers conditional GETs with 304 before the view runs.
+    Pages are keyed on the versions of the tags they depend on, so purging a
+    tag (see posts_app.page_cache.purge) invalidates exactly those pages.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        tags = self.cache_tags(request)
+        if tags is None or request.user.is_authenticated:
+            return self.get_response(request)
+        versions = tag_versions(tags)
+        if versions is None:
+            return self.get_response(request)
+        response, entry = self.lookup(request, versions)
+        if response is None:
+            response = self.store(request, entry, self.get_response(request))
+        return response
+
+    async def __acall__(self, request):
+        tags = self.cache_tags(request)
+        if tags is None or (await request.auser()).is_authenticated:
+            return await self.get_response(request)
+        versions = await atag_versions(tags)
+        if versions is None:
+            return await self.get_response(request)
+        response, entry = self.lookup(request, versions)
+        if response is None:
+            response = self.store(request, entry, await self.get_response(request))
+        return response
+
+    def lookup(self, request, versions):
+        """Return (the 304 or cached response, None), or (None, the entry to store the page under)."""
+        fingerprint = hashlib.md5(
+            f"{settings.PAGE_CACHE_VERSION}|{request.get_full_path()}|{sorted(versions.items())}".encode(),
+            usedforsecurity=False,
+        ).hexdigest()
+        entry = {
+            "key": f"page:{fingerprint}",
+            "etag": f'"{fingerprint}"',
+            "last_modified": int(max(versions.values())) if versions else None,
+            "versions": versions,
+        }
+        not_modified = get_conditional_response(request, etag=entry["etag"], last_modified=entry["last_modified"])
+        if isinstance(not_modified, HttpResponseNotModified):
+            return self.add_validators(not_modified, entry), None
+        cached = page_cache().get(entry["key"])
+        if cached is not None:
+            content, content_type = cached
+            return self.add_validators(HttpResponse(content, content_type=content_type), entry), None
+        return None, entry
+
+    def store(self, request, entry, response):
+        if response.status_code != 200 or response.streaming or response.cookies:
+            return response
+        versions = entry["versions"]
+        if getattr(request, "read_replica", None) and versions and time.time() - max(versions.values()) < settings.REPLICA_STICKY_SECONDS:
+            # rendered from a replica right after a purge: it may predate
+            # the write, so don't keep it under the new versions
+            return self.add_validators(response, entry)
+        page_cache().set(entry["key"], (response.content, response["Content-Type"]), settings.PAGE_CACHE_TIMEOUT)
+        return self.add_validators(response, entry)
+
+    def cache_tags(self, request):
+        if request.method not in ("GET", "HEAD"):
+            return None
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None
+        # lets the timing middleware label requests answered from the cache
+        request.resolver_match = match
+        if match.url_name not in settings.PAGE_CACHE_VIEWS:
+            return None
+        return [tag.format(**match.kwargs) for tag in settings.PAGE_CACHE_VIEWS[match.url_name]]
+
+    def add_validators(self, response, entry):
+        response["ETag"] = entry["etag"]
+        if entry["last_modified"] is not None:
+            response["Last-Modified"] = http_date(entry["last_modified"])
+        # browsers must revalidate, and never reuse an anonymous page once logged in
+        response["Cache-Control"] = "no-cache"
+        patch_vary_headers(response, ("Cookie",))
+        return response
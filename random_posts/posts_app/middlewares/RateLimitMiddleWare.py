@@ -0,0 +1,96 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+from posts_app.metrics import rate_limited_total
+from posts_app.ratelimit import bucket_key, give_back, take
+import functools
+import ipaddress
+import logging
+import math
+
+logger= logging.getLogger("posts_app")
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+# the views whose form posts the username being signed in as; any other
+# request.POST is left unparsed (the new post form carries an upload)
+USERNAME_FORM_VIEWS = ("login",)
+
+
+@functools.lru_cache(maxsize=8)
+def networks(proxies):
+    return [ipaddress.ip_network(proxy.strip(), strict=False) for proxy in proxies]
+
+
+def is_trusted_proxy(address):
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(address in network for network in networks(tuple(settings.RATE_LIMIT_TRUSTED_PROXIES)))
+
+
+class RateLimitMiddleWare:
+    """
+    Answers 429 to the POSTs to the views listed in settings.RATE_LIMITS once
+    one of the client's token buckets (posts_app.ratelimit) is empty. It runs
+    before the CSRF check and decides from the cache alone, so a refused
+    request never reaches the database: no session or user lookup, no
+    password hashing.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method in SAFE_METHODS:
+            return None
+        name = request.resolver_match.url_name
+        taken = []
+        for kind, burst, period in settings.RATE_LIMITS.get(name, ()):
+            identity = self.identify(request, name, kind)
+            if identity is None:
+                continue
+            key = bucket_key(name, kind, identity)
+            wait = take(key, burst, period)
+            if not wait:
+                taken.append((key, burst, period))
+            else:
+                # a refused request costs no token from the other buckets
+                for bucket in taken:
+                    give_back(*bucket)
+                rate_limited_total.inc(name, kind)
+                logger.warning(f"rate limited {name} by {kind}")
+                response = HttpResponse("Too many requests, try again later.", status=429, content_type="text/plain")
+                response["Retry-After"] = str(math.ceil(wait))
+                return response
+        return None
+
+    def identify(self, request, name, kind):
+        if kind == "ip":
+            address = request.META.get("REMOTE_ADDR")
+            # anyone can send the header; only a proxy we run is believed
+            if is_trusted_proxy(address):
+                return request.META.get(settings.RATE_LIMIT_IP_HEADER) or address
+            return address
+        if kind == "username":
+            # the name typed into the login form, else the session of a
+            # logged in user (its cookie, not a session lookup)
+            if name in USERNAME_FORM_VIEWS:
+                username = request.POST.get("username", "").strip().lower()
+                if username:
+                    return username
+            return request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        raise ValueError(f"Unknown rate limit key {kind!r}")
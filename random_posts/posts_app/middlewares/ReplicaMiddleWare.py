@@ -0,0 +1,83 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.views.generic.detail import BaseDetailView
+from django.views.generic.list import BaseListView
+from posts_app.routers import pick_replica, reset_replica, set_replica
+
+STICKY_COOKIE = "read_primary"
+
+
+def reads_from_replica(view_func):
+    # list and detail views read from a replica unless they set
+    # read_from_replica = False
+    view_class = getattr(view_func, "view_class", None)
+    if view_class is None:
+        return False
+    return getattr(view_class, "read_from_replica", issubclass(view_class, (BaseListView, BaseDetailView)))
+
+
+class ReplicaMiddleWare:
+    """
+    Routes the database reads of GET requests to the list and detail views
+    to a replica (posts_app.routers), except for clients that wrote
+    something in the last REPLICA_STICKY_SECONDS: an accepted POST sets a
+    cookie that keeps them on default until the replicas have caught up.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            # awaited by the handler in the request's task, so the replica
+            # chosen here is seen by the view
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.read_replica = None
+        try:
+            response = self.get_response(request)
+        finally:
+            self.release(request)
+        return self.stick(request, response)
+
+    async def __acall__(self, request):
+        request.read_replica = None
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.release(request)
+        return self.stick(request, response)
+
+    def release(self, request):
+        token = getattr(request, "_replica_token", None)
+        if token is not None:
+            reset_replica(token)
+
+    def stick(self, request, response):
+        # forms redirect once they have saved; a re-rendered form wrote nothing
+        if settings.DATABASE_REPLICAS and request.method == "POST" and 300 <= response.status_code < 400:
+            response.set_cookie(
+                STICKY_COOKIE, "1", max_age=settings.REPLICA_STICKY_SECONDS, httponly=True, samesite="Lax"
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        self.choose_replica(request, view_func)
+        return None
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        self.choose_replica(request, view_func)
+        return None
+
+    def choose_replica(self, request, view_func):
+        if request.method not in ("GET", "HEAD") or STICKY_COOKIE in request.COOKIES:
+            return
+        if reads_from_replica(view_func):
+            request.read_replica = pick_replica()
+            if request.read_replica is not None:
+                request._replica_token = set_replica(request.read_replica)
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:01
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+import posts_app.migration_operations
+
+SEARCH_VECTOR = """
+setweight(to_tsvector('pg_catalog.english', coalesce({row}categories, '')), 'A') ||
+setweight(to_tsvector('pg_catalog.english', coalesce({row}content, '')), 'B')
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts_app", "0007_banned_words"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        # one statement per item: psycopg 3 cannot run several in one execute()
+        posts_app.migration_operations.PostgreSQLOnlySQL(
+            sql=[
+                f"""
+                CREATE FUNCTION posts_search_vector_update() RETURNS trigger AS $$
+                BEGIN
+                    NEW.search_vector := {SEARCH_VECTOR.format(row="NEW.")};
+                    RETURN NEW;
+                END
+                $$ LANGUAGE plpgsql
+                """,
+                """
+                CREATE TRIGGER posts_search_vector_trigger
+                BEFORE INSERT OR UPDATE OF content, categories ON posts
+                FOR EACH ROW EXECUTE PROCEDURE posts_search_vector_update()
+                """,
+                f"UPDATE posts SET search_vector = {SEARCH_VECTOR.format(row='')}",
+                "CREATE INDEX posts_search_gin ON posts USING gin (search_vector)",
+            ],
+            reverse_sql=[
+                "DROP INDEX IF EXISTS posts_search_gin",
+                "DROP TRIGGER IF EXISTS posts_search_vector_trigger ON posts",
+                "DROP FUNCTION IF EXISTS posts_search_vector_update()",
+            ],
+        ),
+    ]
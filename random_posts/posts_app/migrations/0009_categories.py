@@ -0,0 +1,138 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def link_existing_posts(apps, schema_editor):
+    from posts_app.categories import split_categories
+
+    Post = apps.get_model("posts_app", "Post")
+    Category = apps.get_model("posts_app", "Category")
+    PostCategory = apps.get_model("posts_app", "PostCategory")
+    category_ids = {}
+    links = []
+    posts = Post.objects.order_by().values_list("id", "categories", "created_at")
+    for post_id, categories, created_at in posts.iterator(chunk_size=2000):
+        for slug, name in split_categories(categories).items():
+            if slug not in category_ids:
+                category_ids[slug] = Category.objects.create(slug=slug, name=name).id
+            links.append(
+                PostCategory(
+                    post_id=post_id,
+                    category_id=category_ids[slug],
+                    created_at=created_at,
+                )
+            )
+        if len(links) >= 2000:
+            PostCategory.objects.bulk_create(links)
+            links = []
+    PostCategory.objects.bulk_create(links)
+    counts = (
+        PostCategory.objects.filter(category=OuterRef("pk"))
+        .order_by()
+        .values("category")
+        .annotate(total=Count("id"))
+        .values("total")
+    )
+    Category.objects.update(post_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts_app", "0008_post_search_vector"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Category",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100, unique=True)),
+                (
+                    "slug",
+                    models.SlugField(allow_unicode=True, max_length=100, unique=True),
+                ),
+                ("post_count", models.IntegerField(default=0)),
+            ],
+            options={
+                "verbose_name_plural": "Categories",
+                "db_table": "categories",
+                "ordering": ["name"],
+                "indexes": [
+                    models.Index(
+                        fields=["-post_count"], name="categories_post_count_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="PostCategory",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField()),
+                (
+                    "category",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="post_links",
+                        to="posts_app.category",
+                    ),
+                ),
+                (
+                    "post",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="category_links",
+                        to="posts_app.post",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "post_categories",
+            },
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="tags",
+            field=models.ManyToManyField(
+                blank=True,
+                related_name="posts",
+                through="posts_app.PostCategory",
+                to="posts_app.category",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="postcategory",
+            index=models.Index(
+                fields=["category", "-created_at", "-post"],
+                name="post_categories_listing_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="postcategory",
+            constraint=models.UniqueConstraint(
+                fields=("post", "category"), name="post_categories_key"
+            ),
+        ),
+        migrations.RunPython(link_existing_posts, migrations.RunPython.noop),
+    ]
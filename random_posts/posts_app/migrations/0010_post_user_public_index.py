@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts_app", "0009_categories"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                condition=models.Q(("visibility", "public")),
+                fields=["user", "-created_at", "-id"],
+                name="posts_user_public_created_idx",
+            ),
+        ),
+    ]
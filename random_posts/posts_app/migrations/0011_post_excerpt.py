@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:39
+
+from django.db import migrations, models
+
+
+def fill_excerpts(apps, schema_editor):
+    from posts_app.excerpts import backfill_excerpts
+
+    for _ in backfill_excerpts(apps.get_model("posts_app", "Post")):
+        pass
+
+
+class Migration(migrations.Migration):
+    # each batch of the backfill commits on its own instead of holding one
+    # transaction (and the row locks) over the whole table
+    atomic = False
+
+    dependencies = [
+        ("posts_app", "0010_post_user_public_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="excerpt",
+            field=models.CharField(editable=False, max_length=200, null=True),
+        ),
+        migrations.RunPython(fill_excerpts, migrations.RunPython.noop),
+    ]
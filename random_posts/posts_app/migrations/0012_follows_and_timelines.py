@@ -0,0 +1,134 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:44
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def add_own_posts_to_timelines(apps, schema_editor):
+    # nobody follows anyone yet: each feed starts with its owner's posts
+    Post = apps.get_model("posts_app", "Post")
+    TimelineEntry = apps.get_model("posts_app", "TimelineEntry")
+    quote = schema_editor.quote_name
+    schema_editor.execute(
+        f"INSERT INTO {quote(TimelineEntry._meta.db_table)} ({quote('user_id')}, {quote('post_id')}, {quote('created_at')}) "
+        f"SELECT {quote('user_id')}, {quote('id')}, {quote('created_at')} FROM {quote(Post._meta.db_table)}"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts_app", "0011_post_excerpt"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customuser",
+            name="feed_pull",
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name="customuser",
+            name="follower_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name="Follow",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("pull", models.BooleanField(default=False)),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "followee",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="followers",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "follower",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="following",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "follows",
+                "indexes": [
+                    models.Index(
+                        fields=["followee", "follower"], name="follows_followee_idx"
+                    ),
+                    models.Index(
+                        condition=models.Q(("pull", True)),
+                        fields=["follower"],
+                        name="follows_pulled_idx",
+                    ),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("follower", "followee"), name="follows_key"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="TimelineEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField()),
+                (
+                    "post",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="timeline_entries",
+                        to="posts_app.post",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="timeline",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "Timeline entries",
+                "db_table": "timeline_entries",
+                "indexes": [
+                    models.Index(
+                        fields=["user", "-created_at", "-post"],
+                        name="timeline_entries_feed_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "post"), name="timeline_entries_key"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(add_own_posts_to_timelines, migrations.RunPython.noop),
+    ]
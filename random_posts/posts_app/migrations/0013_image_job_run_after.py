@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:22
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts_app", "0012_follows_and_timelines"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="imageprocessingjob",
+            name="image_jobs_pending_idx",
+        ),
+        migrations.AddField(
+            model_name="imageprocessingjob",
+            name="run_after",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name="imageprocessingjob",
+            index=models.Index(
+                condition=models.Q(("status", "pending")),
+                fields=["run_after"],
+                name="image_jobs_due_idx",
+            ),
+        ),
+    ]
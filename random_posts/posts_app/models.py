@@ -1,13 +1,29 @@
 from typing import Iterable
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.search import SearchVectorField
 from django.utils import timezone
+from .excerpts import EXCERPT_LENGTH,make_excerpt
 from .validators import validate_email,validate_username,validate_no_bad_words,validate_age,validate_post_length
-from PIL import Image
+from django.core.files.storage import default_storage
 import logging
 
 logger= logging.getLogger("posts_app")
-class CustomUser(AbstractUser):
+
+
+class LoadedValuesMixin:
+    # remembers the column values read from the database so save() and the
+    # signal handlers can tell what actually changed
+    _loaded_values = {}
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+
+class CustomUser(LoadedValuesMixin,AbstractUser):
     SEX_CHOICES = [
         ("M","Male"),
         ("F","Female")
@@ -17,6 +33,11 @@ class CustomUser(AbstractUser):
     bio = models.TextField(blank=True,validators=[validate_no_bad_words])
     email=models.EmailField(unique=True,validators=[validate_email])
     sex = models.CharField(choices=SEX_CHOICES,max_length=10)
+    # kept by posts_app.feed.follow/unfollow
+    follower_count = models.PositiveIntegerField(default=0,editable=False)
+    # set once follower_count passes FEED_FANOUT_MAX_FOLLOWERS: the posts are
+    # then read by the followers' feeds instead of copied into them
+    feed_pull = models.BooleanField(default=False,editable=False)
 
     def __str__(self) -> str:
         return self.username
@@ -30,7 +51,9 @@ class CustomUser(AbstractUser):
             self.last_name = self.last_name.capitalize()
 
         logger.info(f"Saving {self.username} with {self.password}")
-        super().save(*args,**kwargs)
+        # the users rollup counts the signup in the same transaction
+        with transaction.atomic():
+            super().save(*args,**kwargs)
     
 
     def clean(self) -> None:
@@ -42,33 +65,287 @@ class CustomUser(AbstractUser):
         db_table = 'random_posts_users'
         verbose_name = 'User'
         verbose_name_plural = 'Users'
+        indexes = [
+            # get_stats: signups since the start of the month
+            models.Index(fields=['date_joined'],name='users_date_joined_idx'),
+        ]
+
+class PostQuerySet(models.QuerySet):
+    def visible_to(self, viewer):
+        # a private post is only ever loaded for its author
+        if viewer is not None and viewer.is_authenticated:
+            return self.filter(models.Q(visibility="public") | models.Q(user=viewer))
+        return self.filter(visibility="public")
+
+    def for_listing(self, viewer=None, author=None):
+        """
+        Cards for a page of posts. Private posts are listed on their author's
+        own page only, so every other listing is a scan of one of the
+        visibility='public' partial indexes.
+        """
+        queryset = self
+        if author is not None:
+            queryset = queryset.filter(user=author)
+        if author is None or viewer is None or viewer.pk != author.pk:
+            queryset = queryset.filter(visibility="public")
+        # one JOIN for the author instead of a query per card; the stored
+        # excerpt stands in for content
+        return queryset.select_related("user").defer("content","search_vector","user__bio")
+
+    def for_detail(self, viewer=None):
+        return self.visible_to(viewer).select_related("user").defer("search_vector")
 
-class Post(models.Model):
+
+class Post(LoadedValuesMixin,models.Model):
     VISIBILITY_CHOICES =[
         ('public','Public'),
         ('private','Private')
     ]
     user = models.ForeignKey(CustomUser,on_delete=models.CASCADE,related_name="user_posts")
     content= models.TextField(validators=[validate_no_bad_words,validate_post_length])
+    # what the listings show instead of content, set in save()
+    excerpt = models.CharField(max_length=EXCERPT_LENGTH,null=True,editable=False)
     categories = models.CharField(max_length=100,validators=[validate_no_bad_words])
     visibility = models.CharField(max_length=20,choices=VISIBILITY_CHOICES,default='public')
     created_at=models.DateTimeField(default=timezone.now)
+    updated_at=models.DateTimeField(auto_now=True)
     image = models.ImageField(upload_to="post_image/",blank=True,null=True)
-    
+    # filled in by the image worker (posts_app.images), never in the request
+    image_width = models.PositiveIntegerField(blank=True,null=True)
+    image_height = models.PositiveIntegerField(blank=True,null=True)
+    image_variants = models.JSONField(default=list,blank=True)
+    # categories (weight A) + content (weight B), written by a database
+    # trigger on PostgreSQL, see posts_app.search
+    search_vector = SearchVectorField(null=True,editable=False)
+    # the names in categories, one Category each; kept in step by
+    # posts_app.categories, never edited directly
+    tags = models.ManyToManyField("Category",through="PostCategory",related_name="posts",blank=True)
+
+    objects = PostQuerySet.as_manager()
 
     def __str__(self) -> str:
         return f'Post by {self.user.username} on {self.created_at.strftime("%Y-%m-%d %H:%M:%S")}'
     
+    @property
+    def image_srcset(self):
+        return ", ".join(
+            f"{default_storage.url(variant['name'])} {variant['width']}w" for variant in self.image_variants
+        )
+
+    def _image_changed(self):
+        if self._state.adding:
+            return bool(self.image)
+        if "image" not in self._loaded_values:
+            return False
+        return (self.image.name or None) != (self._loaded_values["image"] or None)
+
     def save(self,*args,**kwargs ) :
-        super().save(*args,**kwargs)
-        if self.image:
-            img = Image.open(self.image.path)
-            if img.height > 300 or img.width > 300:
-                img = img.resize((300,300))
-                img.save(self.image.path)
+        self.excerpt = make_excerpt(self.content)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "content" in update_fields:
+            kwargs["update_fields"] = {*update_fields,"excerpt"}
+        image_changed = self._image_changed()
+        stale = []
+        if image_changed:
+            stale = [variant["name"] for variant in self.image_variants]
+            self.image_width = self.image_height = None
+            self.image_variants = []
+        # the rollup, category and timeline signal handlers must run in the
+        # same transaction as the INSERT, so a failed save leaves no counts behind
+        with transaction.atomic():
+            super().save(*args,**kwargs)
+            if stale:
+                # only once the new image is committed: a rolled back save
+                # still points at these files
+                transaction.on_commit(lambda: [default_storage.delete(name) for name in stale])
+        if image_changed:
+            self._loaded_values = {**self._loaded_values,"image":self.image.name}
+            if self.image:
+                # resizing happens in the process_images worker
+                ImageProcessingJob.objects.create(post=self)
 
     class Meta:
         ordering = ['-created_at']#- for descending order
         verbose_name = 'Post'
         verbose_name_plural = 'Posts'
         db_table = 'posts'
+        # the trailing id matches the keyset pagination tie-breaker so a page
+        # is a single index range scan
+        indexes = [
+            models.Index(fields=['-created_at','-id'],name='posts_created_idx'),
+            models.Index(fields=['user','-created_at','-id'],name='posts_user_created_idx'),
+            models.Index(
+                fields=['-created_at','-id'],
+                name='posts_public_created_idx',
+                condition=models.Q(visibility='public'),
+            ),
+            models.Index(
+                fields=['user','-created_at','-id'],
+                name='posts_user_public_created_idx',
+                condition=models.Q(visibility='public'),
+            ),
+        ]
+
+
+class Category(models.Model):
+    name = models.CharField(max_length=100,unique=True)
+    slug = models.SlugField(max_length=100,unique=True,allow_unicode=True)
+    # number of posts linked to it, adjusted with each link written or removed
+    post_count = models.IntegerField(default=0)
+
+    def __str__(self) -> str:
+        return self.name
+
+    class Meta:
+        ordering = ['name']
+        verbose_name_plural = 'Categories'
+        db_table = 'categories'
+        indexes = [
+            # "Explore Topics": the most used categories
+            models.Index(fields=['-post_count'],name='categories_post_count_idx'),
+        ]
+
+
+class PostCategory(models.Model):
+    post = models.ForeignKey(Post,on_delete=models.CASCADE,related_name="category_links")
+    category = models.ForeignKey(Category,on_delete=models.CASCADE,related_name="post_links")
+    # copy of post.created_at so a category page is a range scan of one index
+    created_at = models.DateTimeField()
+
+    def __str__(self) -> str:
+        return f'Post {self.post_id} in {self.category_id}'
+
+    class Meta:
+        db_table = 'post_categories'
+        constraints = [
+            models.UniqueConstraint(fields=['post','category'],name='post_categories_key'),
+        ]
+        indexes = [
+            models.Index(fields=['category','-created_at','-post'],name='post_categories_listing_idx'),
+        ]
+
+
+class Follow(models.Model):
+    follower = models.ForeignKey(CustomUser,on_delete=models.CASCADE,related_name="following")
+    followee = models.ForeignKey(CustomUser,on_delete=models.CASCADE,related_name="followers")
+    # copy of followee.feed_pull, so a feed finds the authors it must read
+    # from without looking at every author followed
+    pull = models.BooleanField(default=False)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self) -> str:
+        return f'{self.follower_id} follows {self.followee_id}'
+
+    class Meta:
+        db_table = 'follows'
+        constraints = [
+            models.UniqueConstraint(fields=['follower','followee'],name='follows_key'),
+        ]
+        indexes = [
+            # fan-out: the followers of an author
+            models.Index(fields=['followee','follower'],name='follows_followee_idx'),
+            models.Index(fields=['follower'],name='follows_pulled_idx',condition=models.Q(pull=True)),
+        ]
+
+
+class TimelineEntry(models.Model):
+    """A post in a user's feed, written when the post is created (posts_app.feed)."""
+    user = models.ForeignKey(CustomUser,on_delete=models.CASCADE,related_name="timeline")
+    post = models.ForeignKey(Post,on_delete=models.CASCADE,related_name="timeline_entries")
+    # copy of post.created_at so a feed page is a range scan of one index
+    created_at = models.DateTimeField()
+
+    def __str__(self) -> str:
+        return f'Post {self.post_id} for {self.user_id}'
+
+    class Meta:
+        db_table = 'timeline_entries'
+        verbose_name_plural = 'Timeline entries'
+        constraints = [
+            models.UniqueConstraint(fields=['user','post'],name='timeline_entries_key'),
+        ]
+        indexes = [
+            models.Index(fields=['user','-created_at','-post'],name='timeline_entries_feed_idx'),
+        ]
+
+
+class ImageProcessingJob(models.Model):
+    STATUS_CHOICES = [
+        ('pending','Pending'),
+        ('done','Done'),
+        ('failed','Failed')
+    ]
+    post = models.ForeignKey(Post,on_delete=models.CASCADE,related_name="image_jobs")
+    status = models.CharField(max_length=10,choices=STATUS_CHOICES,default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    # a failed attempt pushes this back, see posts_app.images
+    run_after = models.DateTimeField(default=timezone.now)
+
+    def __str__(self) -> str:
+        return f'Image job {self.pk} for post {self.post_id} ({self.status})'
+
+    class Meta:
+        ordering = ['created_at']
+        db_table = 'image_processing_jobs'
+        indexes = [
+            models.Index(fields=['run_after'],name='image_jobs_due_idx',condition=models.Q(status='pending')),
+        ]
+
+
+class PostRollup(models.Model):
+    # maintained by posts_app.rollups, read by get_stats
+    day = models.DateField()
+    user = models.ForeignKey(CustomUser,on_delete=models.CASCADE,related_name="post_rollups")
+    category = models.CharField(max_length=100)
+    posts = models.IntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f'{self.posts} posts by {self.user_id} in {self.category} on {self.day}'
+
+    class Meta:
+        db_table = 'post_rollups'
+        constraints = [
+            models.UniqueConstraint(fields=['day','user','category'],name='post_rollups_key'),
+        ]
+
+
+class SignupRollup(models.Model):
+    day = models.DateField(unique=True)
+    signups = models.IntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f'{self.signups} signups on {self.day}'
+
+    class Meta:
+        db_table = 'signup_rollups'
+
+
+class RollupWatermark(models.Model):
+    # rows with an id up to last_id are already counted in the rollup
+    name = models.CharField(max_length=20,unique=True)
+    last_id = models.BigIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f'{self.name} counted up to id {self.last_id}'
+
+    class Meta:
+        db_table = 'rollup_watermarks'
+
+
+class BannedWord(models.Model):
+    # added to settings.BAD_WORDS by posts_app.bad_words, no restart needed
+    word = models.CharField(max_length=100,unique=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return self.word
+
+    def save(self,*args,**kwargs):
+        self.word = self.word.strip().lower()
+        super().save(*args,**kwargs)
+
+    class Meta:
+        ordering = ['word']
+        db_table = 'banned_words'
@@ -0,0 +1,57 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from .models import Post
+import time
+
+
+def page_cache():
+    return caches[settings.PAGE_CACHE_ALIAS]
+
+
+def _tag_key(tag):
+    return f"page_tag:{tag}"
+
+
+def purge(*tags):
+    """Invalidate every cached page depending on one of the tags."""
+    now = time.time()
+    page_cache().set_many({_tag_key(tag): now for tag in tags}, timeout=None)
+
+
+def _initial_version(tag):
+    # a tag missing from the cache (first request, eviction, restart) gets
+    # a version newer than any it had: one rebuilt from the data could
+    # equal an older one (a deleted post leaves Max(updated_at) unchanged)
+    # and bring back pages cached under it. A post's own updated_at only
+    # moves forward, and once the post is deleted the tag has no version.
+    if tag.startswith("post:"):
+        updated_at = Post.objects.filter(pk=tag.split(":", 1)[1]).values_list("updated_at", flat=True).first()
+        return updated_at.timestamp() if updated_at else None
+    return time.time()
+
+
+def tag_versions(tags):
+    """Return {tag: version timestamp}, or None when a tag points at missing data."""
+    cache = page_cache()
+    stored = cache.get_many([_tag_key(tag) for tag in tags])
+    versions = {}
+    for tag in tags:
+        version = stored.get(_tag_key(tag))
+        if version is None:
+            version = _initial_version(tag)
+            if version is None:
+                return None
+            if not cache.add(_tag_key(tag), version, timeout=None):
+                version = cache.get(_tag_key(tag), version)
+        versions[tag] = version
+    return versions
+
+
+async def atag_versions(tags):
+    """tag_versions() for async code; only tags missing from the cache need the database."""
+    stored = page_cache().get_many([_tag_key(tag) for tag in tags])
+    if len(stored) == len(tags):
+        return {tag: stored[_tag_key(tag)] for tag in tags}
+    return await sync_to_async(tag_versions)(tags)
+
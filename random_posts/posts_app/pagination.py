@@ -0,0 +1,197 @@
+import base64
+import binascii
+import datetime
+import json
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from django.http import Http404
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def _json_value(value):
+    # DjangoJSONEncoder truncates microseconds, which would make two posts
+    # created in the same millisecond share a cursor position.
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return value
+
+
+def encode_cursor(values):
+    raw = json.dumps([_json_value(value) for value in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, length):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, binascii.Error):
+        raise InvalidCursor("Malformed cursor")
+    if not isinstance(values, list) or len(values) != length:
+        raise InvalidCursor("Cursor does not match the ordering")
+    return values
+
+
+def flip_ordering(ordering):
+    return tuple(name[1:] if name.startswith("-") else "-" + name for name in ordering)
+
+
+def row_value(row, name):
+    if isinstance(row, dict):
+        return row[name]
+    return getattr(row, name)
+
+
+class KeysetPage:
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next and self.object_list:
+            return self.paginator.cursor_for(self.object_list[-1])
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous and self.object_list:
+            return self.paginator.cursor_for(self.object_list[0])
+        return None
+
+
+class KeysetPaginator:
+    """
+    Seek-method pagination: every page is "the next per_page rows after this
+    key" so page N costs the same index range scan as page 1, unlike the
+    OFFSET scan done by django.core.paginator.Paginator.
+    The ordering must end with a unique column (the pk) to break ties.
+    """
+
+    def __init__(self, queryset, per_page, ordering=("-created_at", "-id")):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+        self.fields = [(name.lstrip("-"), name.startswith("-")) for name in self.ordering]
+
+    def cursor_for(self, row):
+        return encode_cursor([row_value(row, name) for name, _ in self.fields])
+
+    def decode(self, cursor):
+        values = decode_cursor(cursor, len(self.fields))
+        decoded = []
+        for (name, _), value in zip(self.fields, values):
+            # the ordering columns are never NULL, and a NULL would not
+            # compare in seek_filter()
+            if value is None:
+                raise InvalidCursor("Cursor value does not match %s" % name)
+            try:
+                field = self.queryset.model._meta.get_field(name)
+            except FieldDoesNotExist:
+                # annotations (e.g. a search rank) are plain JSON numbers
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    raise InvalidCursor("Cursor value does not match %s" % name)
+                decoded.append(value)
+                continue
+            try:
+                decoded.append(field.to_python(value))
+            except (ValidationError, TypeError, ValueError):
+                raise InvalidCursor("Cursor value does not match %s" % name)
+        return decoded
+
+    def seek_filter(self, values, backwards=False):
+        # (a, b) < (x, y)  <=>  a < x OR (a = x AND b < y), spelled out so
+        # mixed directions work on every backend
+        condition = Q()
+        for index, (name, descending) in enumerate(self.fields):
+            lookup = "lt" if descending != backwards else "gt"
+            term = Q(**{f"{name}__{lookup}": values[index]})
+            for previous, (previous_name, _) in enumerate(self.fields[:index]):
+                term &= Q(**{previous_name: values[previous]})
+            condition |= term
+        return condition
+
+    def page(self, after=None, before=None):
+        if before:
+            rows = list(self.before_queryset(before))
+        else:
+            rows = list(self.after_queryset(after))
+        return self.make_page(rows, after, before)
+
+    async def apage(self, after=None, before=None):
+        if before:
+            rows = [row async for row in self.before_queryset(before)]
+        else:
+            rows = [row async for row in self.after_queryset(after)]
+        return self.make_page(rows, after, before)
+
+    def before_queryset(self, before):
+        values = self.decode(before)
+        return self.queryset.filter(self.seek_filter(values, backwards=True)).order_by(
+            *flip_ordering(self.ordering)
+        )[: self.per_page + 1]
+
+    def after_queryset(self, after):
+        queryset = self.queryset
+        if after:
+            queryset = queryset.filter(self.seek_filter(self.decode(after)))
+        return queryset.order_by(*self.ordering)[: self.per_page + 1]
+
+    def make_page(self, rows, after, before):
+        # one row past the page tells whether there is another page
+        if before:
+            has_previous = len(rows) > self.per_page
+            rows = rows[: self.per_page]
+            rows.reverse()
+            return KeysetPage(rows, self, has_next=True, has_previous=has_previous)
+        has_next = len(rows) > self.per_page
+        return KeysetPage(rows[: self.per_page], self, has_next=has_next, has_previous=bool(after))
+
+
+class KeysetPaginationMixin:
+    """ListView mixin replacing ?page=N with opaque ?after=/?before= cursors."""
+
+    paginate_by = 20
+    keyset_ordering = ("-created_at", "-id")
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, page_size, self.keyset_ordering)
+        try:
+            page = paginator.page(
+                after=self.request.GET.get("after"),
+                before=self.request.GET.get("before"),
+            )
+        except InvalidCursor:
+            raise Http404("Invalid page cursor")
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+    async def apaginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, page_size, self.keyset_ordering)
+        try:
+            page = await paginator.apage(
+                after=self.request.GET.get("after"),
+                before=self.request.GET.get("before"),
+            )
+        except InvalidCursor:
+            raise Http404("Invalid page cursor")
+        return (paginator, page, page.object_list, page.has_other_pages())
@@ -0,0 +1,139 @@
+"""
+Token buckets for RateLimitMiddleWare.
+
+A bucket holds up to `burst` tokens and refills at burst/period tokens a
+second; each request takes one. The buckets live in the RATE_LIMIT_CACHE_ALIAS
+cache, so every worker shares them when it is Redis or memcached. Should that
+cache fail, each process keeps limiting with its own buckets (LocalBuckets).
+"""
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+import hashlib
+import logging
+import math
+import threading
+import time
+
+logger= logging.getLogger("posts_app")
+
+# tokens are counted in thousandths, so slow rates (a few a minute) stay
+# exact in the integer counters of the cache
+UNIT = 1000
+
+
+def now():
+    return time.time()
+
+
+class CacheBuckets:
+    """
+    Buckets in a cache with an atomic incr (Redis, memcached, locmem).
+
+    The cache holds how many units a bucket has spent since the epoch; the
+    units in hand are the ones earned since the epoch (rate * now) minus
+    those. Taking a token is then one incr, with no read-modify-write for
+    two workers to race on.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def take(self, key, burst, period):
+        """Take a token: return 0, or the seconds until one is available."""
+        rate = burst * UNIT / period
+        capacity = burst * UNIT
+        # once idle for a whole period the bucket is full again, which is
+        # what a missing key stands for
+        timeout = math.ceil(period) + 1
+        earned = int(now() * rate)
+        for _ in range(2):
+            self.cache.add(key, earned - capacity, timeout)
+            try:
+                spent = self.cache.incr(key, UNIT)
+                break
+            except ValueError:
+                # expired between add() and incr()
+                continue
+        else:
+            return 0
+        left = earned - spent
+        if left < 0:
+            # refused requests cost nothing
+            self.cache.decr(key, UNIT)
+            return -left / rate
+        if left > capacity - UNIT:
+            # idle for a while: what was earned beyond a full bucket is lost
+            self.cache.incr(key, left - (capacity - UNIT))
+        self.cache.touch(key, timeout)
+        return 0
+
+    def give_back(self, key, burst, period):
+        try:
+            self.cache.decr(key, UNIT)
+        except ValueError:
+            # expired: the bucket is full anyway
+            pass
+
+
+class LocalBuckets:
+    """Buckets of this process only, kept under a lock."""
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()
+
+    def take(self, key, burst, period):
+        rate = burst / period
+        with self.lock:
+            current = now()
+            tokens, updated = self.buckets.pop(key, (burst, current))
+            tokens = min(burst, tokens + (current - updated) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / rate
+            self.buckets[key] = (tokens, current)
+            # least recently used first
+            while len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        return wait
+
+    def give_back(self, key, burst, period):
+        with self.lock:
+            if key in self.buckets:
+                tokens, updated = self.buckets[key]
+                self.buckets[key] = (min(burst, tokens + 1), updated)
+
+
+local_buckets = LocalBuckets()
+
+
+def bucket_key(name, kind, identity):
+    # hashed: usernames may hold characters memcached keys cannot
+    digest = hashlib.sha256(identity.encode()).hexdigest()[:32]
+    return f"ratelimit:{name}:{kind}:{digest}"
+
+
+def buckets():
+    return CacheBuckets(caches[settings.RATE_LIMIT_CACHE_ALIAS])
+
+
+def take(key, burst, period):
+    try:
+        return buckets().take(key, burst, period)
+    except Exception as error:
+        # the cache backends raise their own connection errors; limiting per
+        # process beats not limiting at all
+        logger.warning(f"rate limit cache unavailable, using local buckets: {error!r}")
+        return local_buckets.take(key, burst, period)
+
+
+def give_back(key, burst, period):
+    """Return the token of a request another bucket refused."""
+    try:
+        buckets().give_back(key, burst, period)
+    except Exception:
+        local_buckets.give_back(key, burst, period)
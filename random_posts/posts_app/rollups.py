@@ -0,0 +1,197 @@
+"""
+Per-day counters behind the get_stats command.
+
+Rows with an id up to the rollup's watermark are counted. catch_up(), run by
+get_stats (or a cron job), adds the rows past the watermark with one GROUP BY
+per batch; new rows are not counted while they are saved. Edits and deletes
+of rows that are already counted adjust the counters from the signal
+handlers. Every change to a counter is an upsert adding to it in the
+database, so the request path takes no lock and cannot lose a concurrent
+change.
+
+catch_up() stops short of the rows saved in the last ROLLUP_SETTLE_SECONDS:
+a row whose transaction is still open is invisible to it, and moving the
+watermark past its id would leave it uncounted.
+
+bulk_create / COPY bypass the signal handlers: their rows are picked up by the
+next catch_up() as long as they land past the watermark. Run
+`get_stats --rebuild` after loading rows with lower ids.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import CustomUser, Post, PostRollup, RollupWatermark, SignupRollup
+
+BATCH_SIZE = 50_000
+
+
+def _day(value):
+    return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+
+
+class Rollup:
+    def __init__(self, name, source, target, date_field, group_fields, key_fields, count_field):
+        self.name = name
+        self.source = source
+        self.target = target
+        self.date_field = date_field
+        self.group_fields = group_fields
+        # target columns matching (day, *group_fields)
+        self.key_fields = key_fields
+        self.count_field = count_field
+
+    @property
+    def source_fields(self):
+        return (self.date_field,) + self.group_fields
+
+    def key(self, values):
+        return (_day(values[self.date_field]),) + tuple(values[name] for name in self.group_fields)
+
+    def lock(self, skip_locked=False):
+        """Lock and return the watermark row; call inside transaction.atomic()."""
+        RollupWatermark.objects.get_or_create(name=self.name)
+        return RollupWatermark.objects.select_for_update(skip_locked=skip_locked).filter(name=self.name).first()
+
+    def watermark(self):
+        return RollupWatermark.objects.filter(name=self.name).values_list("last_id", flat=True).first() or 0
+
+    def deltas(self, queryset):
+        rows = (
+            queryset.order_by()
+            .values(*self.group_fields, day=TruncDate(self.date_field))
+            .annotate(rows=Count("pk"))
+        )
+        return {(row["day"],) + tuple(row[name] for name in self.group_fields): row["rows"] for row in rows}
+
+    def apply(self, deltas):
+        """Add {key: change} to the counters."""
+        deltas = {key: change for key, change in deltas.items() if change}
+        if not deltas:
+            return
+        quote = connection.ops.quote_name
+        meta = self.target._meta
+        keys = [quote(meta.get_field(name).column) for name in self.key_fields]
+        count = quote(meta.get_field(self.count_field).column)
+        table = quote(meta.db_table)
+        # INSERT ... ON CONFLICT adds to the row in place, PostgreSQL and
+        # SQLite alike; no read-modify-write for two writers to race on
+        sql = (
+            f"INSERT INTO {table} ({', '.join(keys)}, {count}) VALUES ({', '.join(['%s'] * (len(keys) + 1))}) "
+            f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {count} = {table}.{count} + EXCLUDED.{count}"
+        )
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, [key + (change,) for key, change in deltas.items()])
+            decreased = [key for key, change in deltas.items() if change < 0]
+            if decreased:
+                # also the rows a decrement created: their source row went
+                # in a cascade that had already deleted the counter
+                lookup = {f"{name}__in": {key[index] for key in decreased} for index, name in enumerate(self.key_fields)}
+                self.target.objects.filter(**lookup, **{f"{self.count_field}__lte": 0}).delete()
+
+    def catch_up(self, batch_size=BATCH_SIZE, wait=True):
+        """Count the rows past the watermark; returns how many were counted."""
+        counted = 0
+        while True:
+            # one transaction per batch so a long backlog does not hold the lock
+            with transaction.atomic():
+                mark = self.lock(skip_locked=not wait)
+                if mark is None:
+                    # another process is catching up right now
+                    return counted
+                pending = self.source._default_manager.filter(pk__gt=mark.last_id)
+                upper = list(pending.order_by("pk").values_list("pk", flat=True)[batch_size - 1 : batch_size])
+                upper = upper[0] if upper else pending.aggregate(upper=Max("pk"))["upper"]
+                settling = self.settling(pending)
+                if settling is not None and (upper is None or settling <= upper):
+                    upper = settling - 1
+                if upper is None or upper <= mark.last_id:
+                    return counted
+                deltas = self.deltas(pending.filter(pk__lte=upper))
+                self.apply(deltas)
+                mark.last_id = upper
+                mark.save(update_fields=["last_id"])
+                counted += sum(deltas.values())
+
+    def settling(self, pending):
+        """The lowest id saved too recently to be sure every lower id is committed."""
+        since = timezone.now() - timedelta(seconds=settings.ROLLUP_SETTLE_SECONDS)
+        return pending.filter(**{f"{self.date_field}__gt": since}).aggregate(lowest=Min("pk"))["lowest"]
+
+    def rebuild(self, batch_size=BATCH_SIZE):
+        with transaction.atomic():
+            mark = self.lock()
+            self.target.objects.all().delete()
+            mark.last_id = 0
+            mark.save(update_fields=["last_id"])
+        return self.catch_up(batch_size)
+
+    # signal handlers, run inside the transaction writing the row; they read
+    # the watermark without locking it
+
+    def saved(self, instance, created):
+        values = {name: getattr(instance, name) for name in self.source_fields}
+        loaded = instance._loaded_values
+        instance._loaded_values = {**loaded, **values}
+        if created:
+            # left to catch_up(), unless it has already moved past this id
+            # (a row saved with an old date, see settling())
+            if instance.pk <= self.watermark():
+                self.apply({self.key(values): 1})
+            return
+        if not all(name in loaded for name in self.source_fields):
+            return
+        old, new = self.key(loaded), self.key(values)
+        if old != new and instance.pk <= self.watermark():
+            self.apply({old: -1, new: 1})
+
+    def deleted(self, instance):
+        if instance.pk <= self.watermark():
+            self.apply({self.key({name: getattr(instance, name) for name in self.source_fields}): -1})
+
+
+ROLLUPS = {
+    "posts": Rollup("posts", Post, PostRollup, "created_at", ("user_id", "categories"), ("day", "user_id", "category"), "posts"),
+    "users": Rollup("users", CustomUser, SignupRollup, "date_joined", (), ("day",), "signups"),
+}
+FOR_MODEL = {rollup.source: rollup for rollup in ROLLUPS.values()}
+
+
+def catch_up(batch_size=BATCH_SIZE):
+    return {name: rollup.catch_up(batch_size) for name, rollup in ROLLUPS.items()}
+
+
+def rebuild(batch_size=BATCH_SIZE):
+    return {name: rollup.rebuild(batch_size) for name, rollup in ROLLUPS.items()}
+
+
+def _period(queryset, since, until):
+    if since:
+        queryset = queryset.filter(day__gte=since)
+    if until:
+        queryset = queryset.filter(day__lte=until)
+    return queryset
+
+
+def summarize(since=None, until=None, by_category=False):
+    """Signups and posts between two dates (inclusive) from the rollups."""
+    posts = _period(PostRollup.objects.all(), since, until)
+    summary = {
+        "signups": _period(SignupRollup.objects.all(), since, until).aggregate(total=Sum("signups"))["total"] or 0,
+        "posts": posts.aggregate(total=Sum("posts"))["total"] or 0,
+    }
+    if by_category:
+        summary["categories"] = list(
+            posts.values_list("category").annotate(total=Sum("posts")).order_by("-total", "category")
+        )
+    return summary
+
+
+def top_poster(since=None, until=None):
+    top = (
+        _period(PostRollup.objects.all(), since, until)
+        .values("user_id").annotate(total=Sum("posts")).order_by("-total", "user_id").first()
+    )
+    return CustomUser.objects.filter(pk=top["user_id"]).first() if top else None
@@ -0,0 +1,55 @@
+"""
+Sends reads to the replicas in settings.DATABASE_REPLICAS while a
+replica is selected with use_replica() (ReplicaMiddleWare does it for the
+read-only views), everything else to default.
+
+Replicas lag behind default, so a client that just wrote something is kept
+on default for REPLICA_STICKY_SECONDS (see ReplicaMiddleWare).
+"""
+import contextlib
+import contextvars
+import random
+from django.conf import settings
+
+_replica = contextvars.ContextVar("replica", default=None)
+
+
+def pick_replica():
+    # one replica per request, so a page never mixes two replication delays
+    if settings.DATABASE_REPLICAS:
+        return random.choice(settings.DATABASE_REPLICAS)
+    return None
+
+
+def set_replica(alias):
+    """Read from alias (None: default) until reset_replica(token)."""
+    return _replica.set(alias)
+
+
+def reset_replica(token):
+    _replica.reset(token)
+
+
+@contextlib.contextmanager
+def use_replica(alias=None):
+    token = set_replica(alias or pick_replica())
+    try:
+        yield _replica.get()
+    finally:
+        reset_replica(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _replica.get() or "default"
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as default
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # the schema reaches the replicas through replication
+        return db not in settings.DATABASE_REPLICAS
@@ -0,0 +1,100 @@
+"""
+Full-text search over Post.content and Post.categories.
+
+On PostgreSQL, Post.search_vector is kept up to date by a trigger (migration
+0008). Categories get weight A and content weight B. The GIN index
+posts_search_gin answers the @@ match, and ts_rank orders the hits.
+
+Other backends (the SQLite test runs) use an in-process inverted index with
+the same weights. It is rebuilt whenever the posts table changes. It has no
+stemming and no stop words, so it only approximates the PostgreSQL results,
+and it returns at most the FALLBACK_LIMIT best matches.
+"""
+import math
+import re
+import threading
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import Case, Count, F, FloatField, Max, Value, When
+from django.db.models.functions import Cast
+from .models import Post
+
+SEARCH_CONFIG = "english"
+# same weights as ts_rank's defaults for the A and B labels
+CATEGORY_WEIGHT = 1.0
+CONTENT_WEIGHT = 0.4
+TOKEN = re.compile(r"\w+")
+# the fallback hands its ranks to the database as a CASE expression, so it
+# keeps only the best matches
+FALLBACK_LIMIT = 1000
+
+
+def tokenize(text):
+    return TOKEN.findall(text.lower())
+
+
+def search_posts(queryset, query):
+    """Filter queryset to the posts matching query, annotated with a float `rank`."""
+    if connection.vendor == "postgresql":
+        search_query = SearchQuery(query, search_type="websearch", config=SEARCH_CONFIG)
+        # ts_rank returns a real; as a double it survives the JSON round
+        # trip of the keyset cursor exactly
+        return queryset.filter(search_vector=search_query).annotate(
+            rank=Cast(SearchRank(F("search_vector"), search_query), FloatField())
+        )
+    ranks = fallback_index().search(query)
+    if len(ranks) > FALLBACK_LIMIT:
+        best = sorted(ranks.items(), key=lambda item: (item[1], item[0]), reverse=True)[:FALLBACK_LIMIT]
+        ranks = dict(best)
+    if not ranks:
+        return queryset.none().annotate(rank=Value(0.0, output_field=FloatField()))
+    return queryset.filter(pk__in=ranks).annotate(
+        rank=Case(*[When(pk=pk, then=Value(rank)) for pk, rank in ranks.items()], output_field=FloatField())
+    )
+
+
+class InvertedIndex:
+    def __init__(self):
+        # term -> {post id: weight}
+        self.postings = {}
+        self.lengths = {}
+
+    def add(self, pk, content, categories):
+        weights = {}
+        for term in tokenize(categories or ""):
+            weights[term] = weights.get(term, 0) + CATEGORY_WEIGHT
+        for term in tokenize(content or ""):
+            weights[term] = weights.get(term, 0) + CONTENT_WEIGHT
+        for term, weight in weights.items():
+            self.postings.setdefault(term, {})[pk] = weight
+        self.lengths[pk] = sum(weights.values())
+
+    def search(self, query):
+        """Return {post id: rank} for the posts containing every query term."""
+        terms = set(tokenize(query))
+        if not terms:
+            return {}
+        # intersect starting from the rarest term
+        postings = sorted((self.postings.get(term, {}) for term in terms), key=len)
+        matches = set(postings[0])
+        for posting in postings[1:]:
+            matches &= posting.keys()
+        return {
+            pk: round(sum(posting[pk] for posting in postings) / math.log2(2 + self.lengths[pk]), 6)
+            for pk in matches
+        }
+
+
+_lock = threading.Lock()
+_state = {"index": None, "version": None}
+
+
+def fallback_index():
+    version = tuple(Post.objects.aggregate(count=Count("id"), last=Max("id"), updated=Max("updated_at")).values())
+    with _lock:
+        if _state["version"] != version:
+            index = InvertedIndex()
+            for pk, content, categories in Post.objects.order_by().values_list("id", "content", "categories").iterator():
+                index.add(pk, content, categories)
+            _state["index"], _state["version"] = index, version
+        return _state["index"]
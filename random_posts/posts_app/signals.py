@@ -0,0 +1,87 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from .bad_words import changed as banned_words_changed
+from .categories import post_saved as link_categories, unlink_post
+from .feed import post_saved as fan_out_post, user_deleted as unfollow_all
+from .fragment_cache import invalidate_card
+from .models import BannedWord, CustomUser, Post
+from .page_cache import purge
+from .rollups import FOR_MODEL
+
+
+# before update_rollups, which moves _loaded_values to the saved state
+@receiver(post_save, sender=Post)
+def update_post_categories(sender, instance, created, **kwargs):
+    link_categories(instance, created)
+
+
+# also before update_rollups
+@receiver(post_save, sender=Post)
+def update_timelines(sender, instance, created, **kwargs):
+    fan_out_post(instance, created)
+
+
+@receiver(pre_delete, sender=Post)
+def update_category_counts_on_delete(sender, instance, **kwargs):
+    # the links themselves go with the post (ON DELETE CASCADE)
+    unlink_post(instance)
+
+
+@receiver(pre_delete, sender=CustomUser)
+def update_follower_counts_on_delete(sender, instance, **kwargs):
+    # the Follow rows go with the account (ON DELETE CASCADE), sending no signal
+    unfollow_all(instance)
+
+
+@receiver(post_save, sender=Post)
+def drop_stale_post_card(sender, instance, created, **kwargs):
+    if not created:
+        invalidate_card(instance.pk, instance._loaded_values.get("updated_at"))
+    purge("posts", "users", f"post:{instance.pk}")
+
+
+@receiver(post_delete, sender=Post)
+def drop_deleted_post_card(sender, instance, **kwargs):
+    invalidate_card(instance.pk, instance.updated_at)
+    purge("posts", "users", f"post:{instance.pk}")
+
+
+@receiver(post_save, sender=CustomUser)
+def refresh_cards_on_rename(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) == {"last_login"}:
+        return
+    previous = instance._loaded_values.get("username")
+    if not created and previous is not None and previous != instance.username:
+        # the cards show the author's name; bumping updated_at moves every
+        # card of this author to a new cache key in one UPDATE
+        posts = Post.objects.filter(user=instance)
+        posts.update(updated_at=timezone.now())
+        purge("posts", *(f"post:{pk}" for pk in posts.values_list("pk", flat=True)))
+    purge("users")
+
+
+@receiver(post_delete, sender=CustomUser)
+def purge_deleted_user(sender, instance, **kwargs):
+    purge("users")
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=CustomUser)
+def update_rollups(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) == {"last_login"}:
+        return
+    FOR_MODEL[sender].saved(instance, created)
+
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=CustomUser)
+def update_rollups_on_delete(sender, instance, **kwargs):
+    FOR_MODEL[sender].deleted(instance)
+
+
+@receiver(post_save, sender=BannedWord)
+@receiver(post_delete, sender=BannedWord)
+def reload_banned_words(sender, **kwargs):
+    # other processes notice the change within BAD_WORDS_RELOAD_INTERVAL
+    banned_words_changed()
@@ -0,0 +1,9 @@
+from django import template
+from posts_app.fragment_cache import render_cards
+
+register = template.Library()
+
+
+@register.simple_tag
+def render_post_cards(posts):
+    return render_cards(posts)
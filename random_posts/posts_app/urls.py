@@ -1,12 +1,21 @@
 from django.urls import path
-from .views import UsersListView,HomePageView,PostsListView,UserDetailView,PostDetailView,UserPostsView,UserRagisterView,PostCreateView,UserLoginView,UserLogoutView,UserUpdateView,UpdatePostView,PostDeleteView,CustomUserDeleteView,ErrorPage
+from .api import PostsApiView,UsersApiView
+from .views import UsersListView,HomePageView,PostsListView,UserDetailView,PostDetailView,UserPostsView,UserRagisterView,PostCreateView,UserLoginView,UserLogoutView,UserUpdateView,UpdatePostView,PostDeleteView,CustomUserDeleteView,ErrorPage,MetricsView,PostSearchView,CategoryPostsView,FollowView,UnfollowView,FeedView
 urlpatterns = [
     path("",HomePageView.as_view(),name="home"),
     path('users/',UsersListView.as_view(),name="users-list"), 
     path("posts/",PostsListView.as_view(),name="posts-list"),
+    path("posts/search/",PostSearchView.as_view(),name="posts-search"),
+    # category slugs may be non-ASCII (slugify(allow_unicode=True)), which <slug:> rejects
+    path("categories/<str:slug>/",CategoryPostsView.as_view(),name="category-posts"),
     path("users/<slug:username>/",UserDetailView.as_view(),name="user-details"),
     path("posts/<int:pk>/",PostDetailView.as_view(),name="post-details"),
     path("users/<slug:username>/posts/",UserPostsView.as_view(),name="user-posts"),
+    path("users/<slug:username>/follow/",FollowView.as_view(),name="user-follow"),
+    path("users/<slug:username>/unfollow/",UnfollowView.as_view(),name="user-unfollow"),
+    path("feed/",FeedView.as_view(),name="feed"),
+    path("api/posts/",PostsApiView.as_view(),name="api-posts"),
+    path("api/users/",UsersApiView.as_view(),name="api-users"),
     path('register/',UserRagisterView.as_view(),name='register'),
     path('posts/new/',PostCreateView.as_view(),name='new-post'),
     path("login/",UserLoginView.as_view(),name="login"),
@@ -15,5 +24,6 @@ urlpatterns = [
     path('users/<slug:username>/delete/', CustomUserDeleteView.as_view(), name='delete-account'),
     path("posts/<int:pk>/update/",UpdatePostView.as_view(),name="post-update"),
     path('posts/<int:pk>/delete/',PostDeleteView.as_view(),name="post-delete"),
-    path("error/",ErrorPage.as_view(),name="error_page")
+    path("error/",ErrorPage.as_view(),name="error_page"),
+    path("metrics",MetricsView.as_view(),name="metrics"),
 ]
\ No newline at end of file
@@ -1,14 +1,22 @@
 from typing import Any
 from django.db.models.query import QuerySet
-from django.shortcuts import render,get_object_or_404,HttpResponse,redirect
-from .models import CustomUser,Post
-from django.views.generic import ListView,TemplateView,DetailView,CreateView,FormView,RedirectView,UpdateView,DeleteView
+from django.db.models import Count
+from django.shortcuts import render,get_object_or_404,aget_object_or_404,HttpResponse,redirect
+from .models import CustomUser,Post,Category,PostCategory,Follow
+from django.views.generic import ListView,TemplateView,DetailView,CreateView,FormView,RedirectView,UpdateView,DeleteView,View
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth import login,logout,authenticate
 from .form import CustomUserCreationForm,PostCreationForm,CustomAuthenticationForm,UserUpdateForm,PasswordConfirmationForm
 from django.urls import reverse_lazy
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import HttpResponseForbidden,HttpResponseNotFound
+from django.http import Http404,HttpResponseForbidden,HttpResponseNotFound
+from .pagination import KeysetPaginationMixin,InvalidCursor
+from .async_views import AsyncDetailMixin,AsyncListMixin
+from .search import search_posts
+from .feed import feed_page,follow,unfollow
+from .metrics import REGISTRY
+from .middlewares.LogRequestResponseMiddleWare import error_context
+from django.conf import settings
 import logging
 
 logger= logging.getLogger("posts_app")
@@ -19,50 +27,153 @@ class HomePageView(TemplateView):
         logger.info(f"The home page is visited by {request.user}")
         return super().get(request, *args, **kwargs)
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # read from the stored counts, no COUNT over the posts
+        context["top_categories"] = Category.objects.filter(post_count__gt=0).order_by("-post_count","name")[:12]
+        return context
+
 class ErrorPage(TemplateView):
     template_name = "posts_app/error_page.html" 
 
-class UsersListView(ListView):
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(error_context(404))
+        return context
+
+class MetricsView(View):
+    # Prometheus scrape target; open to settings.METRICS_ALLOWED_IPS and staff
+    def get(self, request, *args, **kwargs):
+        if request.META.get("REMOTE_ADDR") not in settings.METRICS_ALLOWED_IPS and not request.user.is_staff:
+            return HttpResponseForbidden()
+        return HttpResponse(REGISTRY.render(),content_type="text/plain; version=0.0.4; charset=utf-8")
+
+class UsersListView(AsyncListMixin,ListView):
     model = CustomUser
+    queryset = CustomUser.objects.annotate(post_count=Count("user_posts"))
     template_name = "posts_app/users.html"
     context_object_name = "users"#the key name to the template
 
-class PostsListView(ListView):
+class PostsListView(AsyncListMixin,KeysetPaginationMixin,ListView):
     model = Post
+    queryset = Post.objects.for_listing()
     template_name ="posts_app/posts.html"
     context_object_name = "posts"
 
 
+class PostSearchView(KeysetPaginationMixin,ListView):
+    model = Post
+    template_name = "posts_app/search.html"
+    context_object_name = "posts"
+    # best match first; the id breaks ties between equal ranks
+    keyset_ordering = ("-rank","-id")
+
+    def get_queryset(self):
+        self.query = self.request.GET.get("q","").strip()[:200]
+        if not self.query:
+            return Post.objects.none()
+        # private posts are not listed, so their words must not be findable
+        # either
+        return search_posts(Post.objects.for_listing(),self.query)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["query"] = self.query
+        return context
+
+
+class CategoryPostsView(KeysetPaginationMixin,ListView):
+    model = PostCategory
+    template_name = "posts_app/category_posts.html"
+    context_object_name = "links"
+    # pages walk the post_categories_listing_idx index, joining the posts
+    # of one page only
+    keyset_ordering = ("-created_at","-post_id")
+
+    def get_queryset(self):
+        self.category = get_object_or_404(Category,slug=self.kwargs["slug"])
+        return (
+            PostCategory.objects.filter(category=self.category,post__visibility="public")
+            .select_related("post__user")
+            .defer("post__content","post__search_vector","post__user__bio")
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["posts"] = [link.post for link in context["links"]]
+        context["category"] = self.category
+        return context
+
+
 class UserDetailView(DetailView):
     model = CustomUser
+    queryset = CustomUser.objects.annotate(post_count=Count("user_posts"))
     template_name = "posts_app/profile.html"
     context_object_name = "user"
     slug_field = "username"
     slug_url_kwarg = "username"
 
-class PostDetailView(DetailView):
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        viewer = self.request.user
+        context["is_following"] = viewer.is_authenticated and Follow.objects.filter(follower=viewer,followee=self.object).exists()
+        return context
+
+
+class FollowView(LoginRequiredMixin,View):
+    def post(self, request, username):
+        author = get_object_or_404(CustomUser,username=username)
+        if author != request.user:
+            follow(request.user,author)
+            logger.info(f"{request.user} follows {author}")
+        return redirect("user-details",username=username)
+
+
+class UnfollowView(LoginRequiredMixin,View):
+    def post(self, request, username):
+        author = get_object_or_404(CustomUser,username=username)
+        unfollow(request.user,author)
+        return redirect("user-details",username=username)
+
+
+class FeedView(LoginRequiredMixin,ListView):
+    template_name = "posts_app/feed.html"
+    context_object_name = "posts"
+    paginate_by = 20
+
+    def get_queryset(self):
+        # the page is built from the timeline by paginate_queryset
+        return Post.objects.none()
+
+    def paginate_queryset(self, queryset, page_size):
+        try:
+            page = feed_page(self.request.user,page_size,
+                             after=self.request.GET.get("after"),before=self.request.GET.get("before"))
+        except InvalidCursor:
+            raise Http404("Invalid page cursor")
+        return (page.paginator, page, page.object_list, page.has_other_pages())
+
+class PostDetailView(AsyncDetailMixin,DetailView):
     model = Post
     template_name= "posts_app/post_details.html"
     context_object_name = "post"
 
-class UserPostsView(ListView):
+    def get_queryset(self):
+        # someone else's private post is a 404, never loaded
+        return Post.objects.for_detail(getattr(self.request,"user",None))
+
+class UserPostsView(AsyncListMixin,KeysetPaginationMixin,ListView):
     model = Post
     template_name ="posts_app/user_posts.html"
     context_object_name = "posts"
 
-    def get_queryset(self):
-        username = self.kwargs['username']
-        user = get_object_or_404(CustomUser,username=username)
-        return Post.objects.filter(user=user)
+    async def aget_queryset(self):
+        self.author = await aget_object_or_404(CustomUser,username=self.kwargs['username'])
+        return Post.objects.for_listing(getattr(self.request,"user",None),author=self.author)
     
     def get_context_data(self, **kwargs: Any) :
         context = super().get_context_data(**kwargs)
-        print(context)
-        username = self.kwargs['username']
-        user = get_object_or_404(CustomUser,username=username)
-        context['user'] = user
-        print('*'*100)
-        print(context)
+        context['user'] = self.author
         return context
     
 
@@ -130,6 +241,10 @@ class UpdatePostView(LoginRequiredMixin,UpdateView):
     form_class = PostCreationForm
     template_name = "posts_app/update_post.html"
 
+    def get_queryset(self):
+        # only the author's own posts; anyone else gets a 404
+        return Post.objects.filter(user=self.request.user)
+
     def get_success_url(self):
         return reverse_lazy("user-posts",kwargs={"username":self.request.user.username})
     
@@ -178,5 +293,8 @@ class PostDeleteView(LoginRequiredMixin,DeleteView):
     model = Post
     template_name ="posts_app/delete_post.html"
 
+    def get_queryset(self):
+        return Post.objects.filter(user=self.request.user)
+
     def get_success_url(self):
         return reverse_lazy("user-posts",kwargs={"username":self.object.user.username})
\ No newline at end of file
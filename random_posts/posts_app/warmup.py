@@ -0,0 +1,38 @@
+"""
+Work done once in the gunicorn master (preload_app, see gunicorn.conf.py)
+so that every forked worker starts with it done instead of paying for it
+on its first requests: templates parsed into the cached loader and the URL
+resolver populated. Nothing here touches the database, whose connections
+(and pools) must not cross a fork.
+"""
+import os
+from django.template import engines
+from django.template.backends.django import DjangoTemplates
+from django.template.utils import get_app_template_dirs
+from django.urls import get_resolver
+
+
+def template_names(engine):
+    dirs = list(engine.engine.dirs)
+    if engine.engine.app_dirs:
+        dirs += get_app_template_dirs("templates")
+    for directory in dirs:
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if name.endswith(".html"):
+                    yield os.path.relpath(os.path.join(root, name), directory).replace(os.sep, "/")
+
+
+def warm_up():
+    """Return (templates compiled, URL patterns resolved)."""
+    templates = 0
+    for engine in engines.all():
+        if not isinstance(engine, DjangoTemplates):
+            continue
+        for name in template_names(engine):
+            engine.get_template(name)
+            templates += 1
+    resolver = get_resolver()
+    # builds the reverse() and namespace tables of every included URLconf
+    resolver.reverse_dict
+    return templates, len(resolver.reverse_dict)
@@ -11,7 +11,9 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 from pathlib import Path
+import importlib.util
 import os
+import warnings
 from dotenv import load_dotenv
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -46,16 +48,21 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "posts_app.middlewares.LogRequestResponseMiddleWare.RequestIdMiddleWare",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
+    # its process_view refuses before the CSRF check and the view run
+    "posts_app.middlewares.RateLimitMiddleWare.RateLimitMiddleWare",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     #Custom middlewares
     "posts_app.middlewares.LogRequestResponseMiddleWare.ErrorHandlingMiddleWare",
-    "posts_app.middlewares.TimerMiddleWare.PerformanceMiddleware"
+    "posts_app.middlewares.TimerMiddleWare.PerformanceMiddleware",
+    "posts_app.middlewares.PageCacheMiddleWare.AnonymousPageCacheMiddleWare",
+    "posts_app.middlewares.ReplicaMiddleWare.ReplicaMiddleWare",
 ]
 
 ROOT_URLCONF = "random_posts.urls"
@@ -95,10 +102,123 @@ DATABASES = {
         "USER":"postgres",
         "PASSWORD":"postgres",
         "HOST":"db",
-        "PORT":"5432"
+        "PORT":"5432",
     }
 }
 
+# Connection reuse. By default each worker thread keeps its connection for
+# DB_CONN_MAX_AGE seconds ("none": forever, 0: reconnect on every request)
+# and checks it is still alive before reusing it. DB_POOL=1 uses a psycopg 3
+# connection pool per worker process instead (needs "psycopg[binary,pool]",
+# and excludes CONN_MAX_AGE); its sizes come from DB_POOL_MIN_SIZE and
+# DB_POOL_MAX_SIZE, and DB_POOL_TIMEOUT is how long a request waits for a
+# free connection. Without psycopg 3 and psycopg_pool installed DB_POOL is
+# ignored, with a warning.
+db_pool = os.getenv("DB_POOL", "0") == "1"
+if db_pool and not all(importlib.util.find_spec(module) for module in ("psycopg", "psycopg_pool")):
+    warnings.warn('DB_POOL=1 needs "psycopg[binary,pool]"; falling back to DB_CONN_MAX_AGE')
+    db_pool = False
+if db_pool:
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+    DATABASES["default"]["OPTIONS"] = {
+        "pool": {
+            "min_size": int(os.getenv("DB_POOL_MIN_SIZE", 2)),
+            "max_size": int(os.getenv("DB_POOL_MAX_SIZE", 10)),
+            "timeout": float(os.getenv("DB_POOL_TIMEOUT", 10)),
+        },
+    }
+else:
+    conn_max_age = os.getenv("DB_CONN_MAX_AGE", "60")
+    DATABASES["default"]["CONN_MAX_AGE"] = None if conn_max_age.lower() == "none" else int(conn_max_age)
+DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+
+# Read replicas: DATABASE_REPLICA_HOSTS="replica1,replica2:5433" adds one
+# alias per host with the credentials of default. GET requests to the list
+# and detail views read from one of them (posts_app.routers); the test runner
+# mirrors them to the default test database.
+DATABASE_REPLICAS = []
+for number, host in enumerate(filter(None, os.getenv("DATABASE_REPLICA_HOSTS", "").split(",")), start=1):
+    hostname, _, port = host.strip().partition(":")
+    DATABASES[f"replica{number}"] = {
+        **DATABASES["default"],
+        "HOST": hostname,
+        "PORT": port or DATABASES["default"]["PORT"],
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(f"replica{number}")
+DATABASE_ROUTERS = ["posts_app.routers.ReplicaRouter"]
+# after a write the client reads from default for this long, which should
+# exceed the replication lag
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", 10))
+
+# /feed/: a new post is copied into the timeline of each follower of its
+# author, unless the author has more followers than this; the feeds then
+# read that author's posts directly (posts_app.feed)
+FEED_FANOUT_MAX_FOLLOWERS = int(os.getenv("FEED_FANOUT_MAX_FOLLOWERS", 1000))
+# recent posts copied into a timeline when its owner follows someone
+FEED_BACKFILL_POSTS = int(os.getenv("FEED_BACKFILL_POSTS", 50))
+
+# rollups.catch_up() leaves the rows saved this recently for its next run,
+# which must be longer than any transaction inserting posts or users
+ROLLUP_SETTLE_SECONDS = int(os.getenv("ROLLUP_SETTLE_SECONDS", 60))
+
+# Caches
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# post_cards holds rendered post cards; point it at a shared backend
+# (file, RedisCache, ...) when running several workers
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("DEFAULT_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("DEFAULT_CACHE_LOCATION", ""),
+    },
+    "post_cards": {
+        "BACKEND": os.getenv("POST_CARD_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("POST_CARD_CACHE_LOCATION", "post-cards"),
+        "TIMEOUT": int(os.getenv("POST_CARD_CACHE_TIMEOUT", 60 * 60 * 24)),
+    },
+    # token buckets of RateLimitMiddleWare; point it at Redis or memcached so
+    # that all the workers share them
+    "rate_limits": {
+        "BACKEND": os.getenv("RATE_LIMIT_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("RATE_LIMIT_CACHE_LOCATION", "rate-limits"),
+    },
+}
+
+# POSTs allowed per client, by URL name: (key, burst, seconds to refill the
+# whole burst). "ip" buckets by client address, "username" by the username
+# posted to the form or else by the session of the logged in user.
+RATE_LIMITS = {
+    "login": [("ip", 20, 60), ("username", 5, 60)],
+    "register": [("ip", 5, 300)],
+    "new-post": [("username", 10, 60), ("ip", 30, 60)],
+}
+RATE_LIMIT_CACHE_ALIAS = "rate_limits"
+# behind nginx, the client address is in X-Real-IP (see nginx.conf); the
+# header is only read from requests coming from RATE_LIMIT_TRUSTED_PROXIES
+# (addresses or networks, comma separated)
+RATE_LIMIT_IP_HEADER = os.getenv("RATE_LIMIT_IP_HEADER", "REMOTE_ADDR")
+RATE_LIMIT_TRUSTED_PROXIES = list(filter(None, os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "").split(",")))
+POST_CARD_CACHE_ALIAS = "post_cards"
+
+# Whole pages served to anonymous visitors, keyed on the tags they depend on.
+# Tags are purged from posts_app.signals; bump PAGE_CACHE_VERSION on deploys
+# that change templates.
+PAGE_CACHE_ALIAS = "default"
+PAGE_CACHE_TIMEOUT = 60 * 5
+PAGE_CACHE_VERSION = os.getenv("PAGE_CACHE_VERSION", "1")
+PAGE_CACHE_VIEWS = {
+    "home": ["posts"],
+    "posts-list": ["posts"],
+    "category-posts": ["posts"],
+    "posts-search": ["posts"],
+    "post-details": ["post:{pk}"],
+    "users-list": ["users"],
+}
+
+# /metrics is served to these addresses (the Prometheus scraper) and to staff users
+METRICS_ALLOWED_IPS = os.getenv("METRICS_ALLOWED_IPS", "127.0.0.1,::1").split(",")
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -152,6 +272,21 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR,'static')]
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 CRISPY_TEMPLATE_PACK = 'bootstrap5'
+
+# Post images are resized by `manage.py process_images`, not in the request
+POST_IMAGE_SIZES = (300, 600)
+POST_IMAGE_WEBP_QUALITY = 80
+
+# validate_no_bad_words matches these words, the lines of BAD_WORDS_FILE
+# (# starts a comment) and the BannedWord table. Changes to the file or the
+# table are picked up within BAD_WORDS_RELOAD_INTERVAL seconds; the table's
+# through a version number in the default cache, which must then be shared
+# by the workers.
+BAD_WORDS = ['dog','cat','fish','popcorn']
+BAD_WORDS_FILE = os.getenv("BAD_WORDS_FILE")
+# False matches inside words too ("cat" in "category")
+BAD_WORDS_WHOLE_WORDS = os.getenv("BAD_WORDS_WHOLE_WORDS", "false").lower() == "true"
+BAD_WORDS_RELOAD_INTERVAL = 5
 # LOGGING
 LOG_DIR = os.path.join(BASE_DIR, "info_log")
 LOG_FILE = "/api.log"
@@ -167,6 +302,12 @@ else:
     with open(LOG_PATH, "w") as f:  # clear log file
         f.write("")
 
+# Records go through in-memory queues (posts_app.log_handlers) and are written
+# by background threads in batches. The files are only appended to, by every
+# worker; rotate them with logrotate (copytruncate), not from the app. LOG_INFO_SAMPLE_RATE keeps that share of
+# INFO records, chosen per request; warnings and errors are always kept.
+LOG_INFO_SAMPLE_RATE = float(os.getenv("LOG_INFO_SAMPLE_RATE", "1.0"))
+
 LOGGING = {
     "version":1,
      'disable_existing_loggers': False,
@@ -179,6 +320,18 @@ LOGGING = {
               'format': '{asctime} {levelname}  {message}',
             'style': '{',
              
+         },
+         "json":{
+             "()":"posts_app.log_handlers.JsonFormatter",
+         }
+     },
+     "filters":{
+         "request_id":{
+             "()":"posts_app.log_handlers.RequestIdFilter",
+         },
+         "sample_info":{
+             "()":"posts_app.log_handlers.SampleInfoFilter",
+             "rate":LOG_INFO_SAMPLE_RATE,
          }
      },
      'handlers': {
@@ -187,30 +340,47 @@ LOGGING = {
             'formatter': 'simple',
         },
         'file': {
-            'class': 'logging.FileHandler',
+            'class': 'posts_app.log_handlers.BufferedFileHandler',
             'filename': os.path.join(BASE_DIR, 'info_log','info.log'),
-            'formatter': 'verbose',
+            'formatter': 'json',
         },
          'file_app': {
-            'class': 'logging.FileHandler',
+            'class': 'posts_app.log_handlers.BufferedFileHandler',
             'filename': os.path.join(BASE_DIR, 'info_log','info_app.log'),
-            'formatter': 'verbose',
+            'formatter': 'json',
+        },
+        # the only handlers the loggers call: they enqueue and return
+        'queue_django': {
+            '()': 'posts_app.log_handlers.AsyncQueueHandler',
+            'handlers': ['console','file'],
+            'filters': ['request_id','sample_info'],
+        },
+        'queue_app': {
+            '()': 'posts_app.log_handlers.AsyncQueueHandler',
+            'handlers': ['console','file_app'],
+            'filters': ['request_id','sample_info'],
         },
     },
      "loggers":{
          "django":{
-             "handlers":["console","file"],
+             "handlers":["queue_django"],
              "level":"INFO",
              "propagate":True
          },
          "posts_app":{
-             "handlers":["console","file_app"],
+             "handlers":["queue_app"],
              "level":"INFO",
              "propagate":True#set it to false if you want only the info logger to be called
+         },
+         # holds the handlers the queues write to, see posts_app.log_handlers;
+         # nothing logs here
+         "posts_app.log_targets":{
+             "handlers":["console","file","file_app"],
+             "level":"CRITICAL",
+             "propagate":False
          }
          
      }
 
 
 }
-
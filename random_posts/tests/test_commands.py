@@ -0,0 +1,183 @@
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from io import StringIO
+from unittest import mock
+import json
+import os
+import tempfile
+from posts_app.models import CustomUser,Post,PostRollup,RollupWatermark,SignupRollup
+from posts_app import bulk_io, rollups
+
+
+class GenerateFakeDataTest(TestCase):
+    def test_bulk_generation(self):
+        call_command("generate_fake_data",users=7,posts=30,batch_size=4,workers=1,stdout=StringIO())
+        self.assertEqual(CustomUser.objects.filter(username__startswith="fake_user").count(),7)
+        self.assertEqual(Post.objects.count(),30)
+        self.assertFalse(Post.objects.filter(excerpt__isnull=True).exists())
+        self.assertFalse(CustomUser.objects.first().has_usable_password())
+
+    def test_shared_password(self):
+        call_command("generate_fake_data",users=2,posts=0,workers=1,password="loadtest123",stdout=StringIO())
+        user = CustomUser.objects.first()
+        self.assertTrue(user.check_password("loadtest123"))
+
+
+class ImportExportTest(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username="exporter",email="exporter@example.com",password="password123")
+        Post.objects.create(user=self.user,content="First exported post, with a comma\nand a newline",categories="Export")
+        Post.objects.create(user=self.user,content="Second exported post content",categories="Export",visibility="private")
+        self.directory = tempfile.mkdtemp()
+
+    def round_trip(self, extension):
+        users_path = os.path.join(self.directory,f"users.{extension}")
+        posts_path = os.path.join(self.directory,f"posts.{extension}")
+        call_command("export_data","users",users_path,stderr=StringIO())
+        call_command("export_data","posts",posts_path,stderr=StringIO())
+        expected = list(Post.objects.order_by("pk").values())
+        CustomUser.objects.all().delete()
+        call_command("import_data","users",users_path,stdout=StringIO())
+        call_command("import_data","posts",posts_path,stdout=StringIO())
+        self.assertEqual(list(Post.objects.order_by("pk").values()),expected)
+        self.assertTrue(CustomUser.objects.get(username="exporter").check_password("password123"))
+
+    def test_csv_round_trip(self):
+        self.round_trip("csv")
+
+    def test_jsonl_round_trip(self):
+        self.round_trip("jsonl")
+
+    def test_invalid_rows_are_skipped(self):
+        path = os.path.join(self.directory,"posts.jsonl")
+        with open(path,"w") as output:
+            for content in ["A perfectly fine imported post","My cat wrote this imported post","short"]:
+                output.write(json.dumps({"user_id":self.user.pk,"content":content,"categories":"Import"})+"\n")
+        stderr = StringIO()
+        call_command("import_data","posts",path,stdout=StringIO(),stderr=stderr)
+        self.assertTrue(Post.objects.filter(content="A perfectly fine imported post").exists())
+        self.assertEqual(Post.objects.filter(categories="Import").count(),1)
+        self.assertIn("bad words",stderr.getvalue())
+
+    def test_strict_import_aborts(self):
+        path = os.path.join(self.directory,"posts.jsonl")
+        with open(path,"w") as output:
+            output.write(json.dumps({"user_id":self.user.pk,"content":"short","categories":"Import"})+"\n")
+        with self.assertRaises(CommandError):
+            call_command("import_data","posts",path,strict=True,stdout=StringIO())
+
+    def test_empty_csv(self):
+        path = os.path.join(self.directory,"posts.csv")
+        open(path,"w").close()
+        with self.assertRaisesMessage(CommandError,"empty"):
+            call_command("import_data","posts",path,stdout=StringIO())
+
+    def test_unknown_keys_are_skipped(self):
+        path = os.path.join(self.directory,"posts.jsonl")
+        with open(path,"w") as output:
+            output.write(json.dumps({"user_id":self.user.pk,"content":"A row with a typo in a key","categorys":"Import"})+"\n")
+            output.write("not json\n")
+            output.write(json.dumps({"user_id":self.user.pk,"content":"A row with only known keys","categories":"Import"})+"\n")
+        stderr = StringIO()
+        call_command("import_data","posts",path,stdout=StringIO(),stderr=stderr)
+        self.assertEqual(list(Post.objects.filter(categories="Import").values_list("content",flat=True)),["A row with only known keys"])
+        self.assertIn("categorys: unknown column",stderr.getvalue())
+        self.assertIn("Skipping row 2: invalid JSON",stderr.getvalue())
+
+    def test_copy_rows_get_the_field_defaults(self):
+        copies = []
+        rows = [
+            {"user_id":self.user.pk,"content":"A row without the optional fields","categories":"Import"},
+            {"id":999,"user_id":self.user.pk,"content":"A row with its own id","categories":"Import","visibility":"private"},
+        ]
+        with mock.patch.object(bulk_io,"use_copy",return_value=True), \
+             mock.patch.object(bulk_io,"copy_in",side_effect=lambda model,names,rows: copies.append((names,rows))):
+            bulk_io.write_batch(Post,rows)
+        self.assertEqual(len(copies),2)
+        (names, rows), (names_with_id, rows_with_id) = copies
+        self.assertNotIn("id",names)
+        self.assertEqual(names_with_id[0],"id")
+        row = rows[0]
+        self.assertEqual(row["visibility"],"public")
+        self.assertEqual(row["image_variants"],[])
+        self.assertIsNotNone(row["created_at"])
+        self.assertIsNotNone(row["updated_at"])
+        self.assertEqual(rows_with_id[0]["visibility"],"private")
+        # every column gets a value, none is left to a database default
+        self.assertEqual(set(names),{f.attname for f in bulk_io.export_fields(Post)}-{"id"})
+
+
+class BackfillExcerptsTest(TestCase):
+    def test_posts_without_excerpt_are_filled(self):
+        user = CustomUser.objects.create_user(username="backfiller",email="backfiller@example.com",password="password123")
+        Post.objects.bulk_create([
+            Post(user=user,content=f"Bulk loaded post number {i} without an excerpt",categories="Bulk") for i in range(5)
+        ])
+        self.assertEqual(Post.objects.filter(excerpt__isnull=True).count(),5)
+        output = StringIO()
+        call_command("backfill_excerpts",batch_size=2,stdout=output)
+        self.assertIn("Filled 5 excerpts",output.getvalue())
+        self.assertEqual(
+            sorted(Post.objects.values_list("excerpt",flat=True)),
+            [f"Bulk loaded post number {i} without an excerpt" for i in range(5)],
+        )
+
+
+@override_settings(ROLLUP_SETTLE_SECONDS=0)
+class GetStatsTest(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username="stats",email="stats@example.com",password="password123")
+        self.other = CustomUser.objects.create_user(username="other",email="other@example.com",password="password123")
+        for _ in range(3):
+            Post.objects.create(user=self.user,content="A post that is counted",categories="News")
+        Post.objects.create(user=self.other,content="Another counted post",categories="Sport")
+
+    def test_catch_up_counts_new_rows_once(self):
+        self.assertEqual(rollups.catch_up(),{"posts":4,"users":2})
+        self.assertEqual(rollups.catch_up(),{"posts":0,"users":0})
+        Post.objects.bulk_create([Post(user=self.other,content="Bulk created post",categories="Sport")])
+        self.assertEqual(rollups.catch_up()["posts"],1)
+        self.assertEqual(rollups.summarize(by_category=True)["categories"],[("News",3),("Sport",2)])
+
+    def test_edits_and_deletes_of_counted_rows(self):
+        rollups.catch_up()
+        post = Post.objects.filter(categories="News").first()
+        post.categories = "Sport"
+        post.save()
+        Post.objects.filter(user=self.other).delete()
+        self.assertEqual(rollups.summarize(by_category=True)["categories"],[("News",2),("Sport",1)])
+        self.user.delete()
+        self.assertFalse(PostRollup.objects.exists())
+        self.assertEqual(SignupRollup.objects.get().signups,1)
+
+    def test_rows_created_below_the_watermark(self):
+        rollups.catch_up()
+        # a concurrent catch_up() moved past the id while the INSERT was uncommitted
+        RollupWatermark.objects.filter(name="posts").update(last_id=10**9)
+        Post.objects.create(user=self.user,content="Created after a catch up",categories="News")
+        self.assertEqual(rollups.summarize()["posts"],5)
+
+    @override_settings(ROLLUP_SETTLE_SECONDS=60)
+    def test_catch_up_leaves_recent_rows(self):
+        first = Post.objects.order_by("pk").first()
+        Post.objects.filter(pk=first.pk).update(created_at=first.created_at.replace(year=2000))
+        # every row but the back-dated post is younger than the settle delay
+        self.assertEqual(rollups.catch_up(),{"posts":1,"users":0})
+        self.assertEqual(RollupWatermark.objects.get(name="posts").last_id,first.pk)
+        with override_settings(ROLLUP_SETTLE_SECONDS=0):
+            self.assertEqual(rollups.catch_up(),{"posts":3,"users":2})
+
+    def test_command_output(self):
+        out = StringIO()
+        call_command("get_stats","--by-category",stdout=out)
+        output = out.getvalue()
+        self.assertIn("Users registered this month 2",output)
+        self.assertIn("Posts created this month 4",output)
+        self.assertIn("User with highest number of posts stats",output)
+        self.assertIn("News: 3",output)
+        out = StringIO()
+        call_command("get_stats","--since","2000-01-01","--until","2000-12-31",stdout=out)
+        self.assertIn("Posts created from 2000-01-01 to 2000-12-31 0",out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command("get_stats","--since","2001-01-01","--until","2000-12-31",stdout=StringIO())
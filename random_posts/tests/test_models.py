@@ -1,6 +1,16 @@
 from django.test import TestCase,override_settings
 import tempfile
-from posts_app.models import CustomUser,Post
+from django.conf import settings
+from posts_app.models import CustomUser,Post,ImageProcessingJob,BannedWord,Category,PostCategory
+from posts_app.categories import split_categories,link_new_posts
+from posts_app import bad_words
+from posts_app.bad_words import BadWordMatcher,reload as reload_bad_words
+from posts_app.validators import validate_no_bad_words
+from posts_app import images
+from posts_app.images import process_pending_jobs
+from django.utils import timezone
+from datetime import timedelta
+from unittest import mock
 from django.core.exceptions import ValidationError
 from django.core.files.uploadedfile import SimpleUploadedFile
 from PIL import Image
@@ -95,10 +105,68 @@ class PostModelTest(TestCase):
         self.assertEqual(posts[0],post2)
         self.assertEqual(posts[1],self.post)
 
+    def test_image_processing_is_queued(self):
+        self.assertEqual(self.post.image_variants,[])
+        self.assertTrue(ImageProcessingJob.objects.filter(post=self.post,status='pending').exists())
+
     def test_image_resize(self):
-        img = Image.open(self.post.image.path)
+        process_pending_jobs()
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.image_width,self.post.image_height),(500,500))
+        smallest = self.post.image_variants[0]
+        img = Image.open(os.path.join(settings.MEDIA_ROOT,smallest['name']))
+        self.assertEqual(img.format,'WEBP')
         self.assertLessEqual(img.width,300)
         self.assertLessEqual(img.height,300)
+        self.assertIn(' 300w',self.post.image_srcset)
+
+    def test_image_resize_keeps_aspect_ratio(self):
+        Image.new('RGB',(900,300),'red').save(self.image_path)
+        with open(self.image_path,'rb') as img:
+            self.post.image = SimpleUploadedFile('wide.jpg',img.read(),content_type="image/jpeg")
+        self.post.save()
+        process_pending_jobs()
+        self.post.refresh_from_db()
+        self.assertEqual(
+            [(variant['width'],variant['height']) for variant in self.post.image_variants],
+            [(300,100),(600,200)],
+        )
+
+    def test_replaced_image_variants_are_deleted_on_commit(self):
+        process_pending_jobs()
+        self.post.refresh_from_db()
+        old = [os.path.join(settings.MEDIA_ROOT,variant['name']) for variant in self.post.image_variants]
+        with open(self.image_path,'rb') as img:
+            self.post.image = SimpleUploadedFile('other.jpg',img.read(),content_type="image/jpeg")
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.post.save()
+        self.assertTrue(all(os.path.exists(path) for path in old))
+        for callback in callbacks:
+            callback()
+        self.assertFalse(any(os.path.exists(path) for path in old))
+
+    def test_failing_jobs_back_off(self):
+        job = ImageProcessingJob.objects.get(post=self.post)
+        with mock.patch.object(images,"process_job",side_effect=OSError("storage down")):
+            self.assertEqual(process_pending_jobs(),1)
+            job.refresh_from_db()
+            self.assertEqual((job.status,job.attempts,job.error),("pending",1,"storage down"))
+            self.assertGreater(job.run_after,timezone.now()+timedelta(seconds=images.RETRY_DELAY-5))
+            # not due yet: the worker does not spin on it
+            self.assertEqual(process_pending_jobs(),0)
+            ImageProcessingJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            self.assertEqual(process_pending_jobs(),1)
+            job.refresh_from_db()
+            self.assertGreater(job.run_after,timezone.now()+timedelta(seconds=2*images.RETRY_DELAY-5))
+
+    def test_excerpt_follows_content(self):
+        self.assertEqual(self.post.excerpt,'This is a test post.')
+        self.post.content = 'word ' * 100
+        self.post.save(update_fields=['content'])
+        self.post.refresh_from_db()
+        self.assertEqual(len(self.post.excerpt),200)
+        self.assertTrue(self.post.excerpt.startswith('word word'))
+        self.assertTrue(self.post.excerpt.endswith('…'))
 
     def test_post_validation(self):
         self.post.content = 'Short'
@@ -113,4 +181,93 @@ class PostModelTest(TestCase):
         self.assertEqual(self.post.content, 'Updated content.')
         # Delete
         self.post.delete()
-        self.assertEqual(Post.objects.count(), 0)
\ No newline at end of file
+        self.assertEqual(Post.objects.count(), 0)
+
+
+class BadWordsTest(TestCase):
+    def tearDown(self):
+        reload_bad_words()
+
+    def test_matcher(self):
+        matcher = BadWordMatcher(["cat","category","cart","c++"," Dog "])
+        self.assertEqual(matcher.search("A CATEGORY"),"cat")
+        self.assertEqual(matcher.search("I code in C++"),"c++")
+        self.assertEqual(matcher.search("hotdogs"),"dog")
+        self.assertIsNone(matcher.search("a car"))
+        self.assertEqual(matcher.find(["fine","my cart","ok"]),[1])
+
+    def test_whole_words(self):
+        matcher = BadWordMatcher(["cat","category"],whole_words=True)
+        self.assertEqual(matcher.search("this category"),"category")
+        self.assertEqual(matcher.search("cat."),"cat")
+        self.assertIsNone(matcher.search("cats and concatenate"))
+
+    def test_validator_reloads_sources(self):
+        with self.assertRaises(ValidationError):
+            validate_no_bad_words("I love popcorn")
+        validate_no_bad_words("I love grapes")
+        BannedWord.objects.create(word="Grapes")
+        with self.assertRaises(ValidationError):
+            validate_no_bad_words("I love grapes")
+        with tempfile.NamedTemporaryFile("w",suffix=".txt",delete=False) as words:
+            words.write("# fruit\nbanana\n")
+        with override_settings(BAD_WORDS_FILE=words.name,BAD_WORDS=[]):
+            validate_no_bad_words("I love popcorn")
+            with self.assertRaises(ValidationError):
+                validate_no_bad_words("I love bananas")
+        os.unlink(words.name)
+
+    @override_settings(BAD_WORDS_RELOAD_INTERVAL=0)
+    def test_other_processes_reload_on_the_version_bump(self):
+        validate_no_bad_words("I love mangoes")
+        # written by another process: no signal here, and the table is not polled
+        BannedWord.objects.bulk_create([BannedWord(word="mangoes")])
+        validate_no_bad_words("I love mangoes")
+        # what changed() in that process does once its transaction commits
+        bad_words._bump_version()
+        with self.assertRaises(ValidationError):
+            validate_no_bad_words("I love mangoes")
+
+
+class CategoryTest(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username="tagger", email="tagger@example.com", password="password123")
+
+    def counts(self):
+        return dict(Category.objects.values_list("slug","post_count"))
+
+    def test_split_categories(self):
+        self.assertEqual(split_categories(" News,  Local   sport,news,, !! "), {"news":"News","local-sport":"Local sport"})
+
+    def test_name_taken_under_another_slug(self):
+        # renamed in the admin: "News" now lives at /categories/breaking/
+        news = Category.objects.create(name="News", slug="breaking")
+        post = Post.objects.create(user=self.user, content="First", categories="News, Sport")
+        self.assertEqual(self.counts(), {"breaking":1,"sport":1})
+        self.assertEqual(set(post.category_links.values_list("category_id",flat=True)), {news.pk,Category.objects.get(slug="sport").pk})
+        post.categories = "News"
+        post.save()
+        self.assertEqual(self.counts(), {"breaking":1,"sport":0})
+
+    def test_links_and_counts_follow_the_text(self):
+        post = Post.objects.create(user=self.user, content="First", categories="News, Sport")
+        other = Post.objects.create(user=self.user, content="Second", categories="news")
+        self.assertEqual(self.counts(), {"news":2,"sport":1})
+        self.assertEqual(set(post.tags.values_list("slug",flat=True)), {"news","sport"})
+        self.assertEqual(PostCategory.objects.get(post=other).created_at, other.created_at)
+
+        post.categories = "Sport, Travel"
+        post.save()
+        self.assertEqual(self.counts(), {"news":1,"sport":1,"travel":1})
+        other.delete()
+        self.assertEqual(self.counts(), {"news":0,"sport":1,"travel":1})
+        self.user.delete()
+        self.assertEqual(self.counts(), {"news":0,"sport":0,"travel":0})
+        self.assertFalse(PostCategory.objects.exists())
+
+    def test_link_new_posts_after_bulk_create(self):
+        Post.objects.bulk_create([Post(user=self.user, content=f"Bulk {i}", categories="Bulk, Misc") for i in range(5)])
+        self.assertEqual(link_new_posts(batch_size=2), 5)
+        self.assertEqual(self.counts(), {"bulk":5,"misc":5})
+        self.assertEqual(link_new_posts(), 0)
+
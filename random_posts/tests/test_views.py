@@ -1,9 +1,30 @@
-from django.test import TestCase,Client
+from django.test import TestCase,Client,RequestFactory,override_settings
+from django.conf import settings
 from django.urls import reverse
-from posts_app.models import CustomUser,Post
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from posts_app.models import CustomUser,Post,Follow,TimelineEntry
+from posts_app.pagination import KeysetPaginator,InvalidCursor,encode_cursor
+from posts_app.fragment_cache import card_cache,card_cache_stats
+from posts_app.page_cache import page_cache
+from posts_app.metrics import Histogram,errors_total,db_connections_opened
+from django.db.backends.signals import connection_created
+from django.core.cache import caches
+from unittest import mock
+from posts_app import log_handlers, ratelimit
+from posts_app.log_handlers import BufferedFileHandler,JsonFormatter,SampleInfoFilter
+from posts_app.routers import ReplicaRouter,use_replica
+from posts_app.middlewares.RateLimitMiddleWare import RateLimitMiddleWare
+from posts_app.middlewares.ReplicaMiddleWare import STICKY_COOKIE
+import json
+import logging
+import os
+import tempfile
 
 class ViewsTest(TestCase):
     def setUp(self):
+        page_cache().clear()
         self.client = Client()
 
         self.user = CustomUser.objects.create_user(
@@ -115,4 +136,713 @@ class ViewsTest(TestCase):
         self.assertFalse(Post.objects.filter(pk=self.post.pk).exists())
 
 
+class PostsPaginationTest(TestCase):
+    def setUp(self):
+        page_cache().clear()
+        self.user = CustomUser.objects.create_user(
+            username="pageuser",
+            email="pageuser@example.com",
+            password="password123",
+        )
+        created_at = timezone.now()
+        # identical timestamps force the id tie-breaker to do its job
+        Post.objects.bulk_create([
+            Post(user=self.user, content=f"Paginated post number {i}", categories="Paging", created_at=created_at)
+            for i in range(25)
+        ])
+
+    def test_first_page_is_limited(self):
+        response = self.client.get(reverse("posts-list"))
+        self.assertEqual(len(response.context["posts"]), 20)
+        self.assertTrue(response.context["page_obj"].has_next())
+        self.assertFalse(response.context["page_obj"].has_previous())
+
+    def test_next_and_previous_cursors(self):
+        first = self.client.get(reverse("posts-list"))
+        first_ids = [post.pk for post in first.context["posts"]]
+        second = self.client.get(reverse("posts-list"), {"after": first.context["page_obj"].next_cursor})
+        second_ids = [post.pk for post in second.context["posts"]]
+        self.assertEqual(len(second_ids), 5)
+        self.assertFalse(set(first_ids) & set(second_ids))
+        self.assertFalse(second.context["page_obj"].has_next())
+        back = self.client.get(reverse("posts-list"), {"before": second.context["page_obj"].previous_cursor})
+        self.assertEqual([post.pk for post in back.context["posts"]], first_ids)
+        self.assertFalse(back.context["page_obj"].has_previous())
+
+    def test_user_posts_are_paginated(self):
+        response = self.client.get(reverse("user-posts", kwargs={"username": self.user.username}))
+        self.assertEqual(len(response.context["posts"]), 20)
+        self.assertContains(response, "Older posts")
+
+    def test_invalid_cursor(self):
+        paginator = KeysetPaginator(Post.objects.all(), 20)
+        with self.assertRaises(InvalidCursor):
+            paginator.page(after="not-a-cursor")
+        # well-formed cursors holding values of the wrong type
+        for values in ([123, 1], [None, 1], ["2024-01-01T00:00:00+00:00", "one"]):
+            with self.assertRaises(InvalidCursor):
+                paginator.page(after=encode_cursor(values))
+
+
+class ListingQueryCountTest(TestCase):
+    def create_posts(self, count):
+        start = Post.objects.count()
+        for i in range(start, start + count):
+            user = CustomUser.objects.create(username=f"author{i}", email=f"author{i}@example.com")
+            Post.objects.create(user=user, content="A post long enough to be valid", categories="Count")
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_posts_list_query_count_is_constant(self):
+        self.create_posts(2)
+        few = self.count_queries(reverse("posts-list"))
+        self.create_posts(10)
+        many = self.count_queries(reverse("posts-list"))
+        self.assertEqual(few, many)
+
+    def test_users_list_query_count_is_constant(self):
+        self.create_posts(2)
+        few = self.count_queries(reverse("users-list"))
+        self.create_posts(10)
+        many = self.count_queries(reverse("users-list"))
+        self.assertEqual(few, many)
+
+    def test_post_count_is_annotated(self):
+        self.create_posts(1)
+        author = CustomUser.objects.get(username="author0")
+        Post.objects.create(user=author, content="A second post long enough", categories="Count")
+        response = self.client.get(reverse("user-details", kwargs={"username": author.username}))
+        self.assertEqual(response.context["user"].post_count, 2)
+
+    def test_listing_shows_preview_only(self):
+        user = CustomUser.objects.create(username="longwriter", email="longwriter@example.com")
+        Post.objects.create(user=user, content="x" * 150 + "y" * 150, categories="Long")
+        response = self.client.get(reverse("posts-list"))
+        self.assertContains(response, "x" * 150)
+        self.assertNotContains(response, "y" * 100)
+
+
+class PostVisibilityTest(TestCase):
+    def setUp(self):
+        page_cache().clear()
+        self.author = CustomUser.objects.create_user(username="author", email="author@example.com", password="password123")
+        CustomUser.objects.create_user(username="other", email="other@example.com", password="password123")
+        self.public = Post.objects.create(user=self.author, content="Anyone may read this post", categories="Open")
+        self.private = Post.objects.create(user=self.author, content="Kept between me and myself", categories="Diary", visibility="private")
+
+    def test_listings_never_load_others_private_posts(self):
+        self.client.login(username="other", password="password123")
+        for url in (reverse("posts-list"), reverse("user-posts", kwargs={"username": "author"})):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(list(response.context["posts"]), [self.public])
+            self.assertNotContains(response, "Kept between")
+            self.assertIn("visibility", queries[-1]["sql"])
+
+    def test_author_sees_own_private_posts(self):
+        self.client.login(username="author", password="password123")
+        response = self.client.get(reverse("user-posts", kwargs={"username": "author"}))
+        self.assertEqual(list(response.context["posts"]), [self.private, self.public])
+        self.assertContains(response, "Kept between")
+        self.assertEqual(self.client.get(reverse("post-details", args=[self.private.pk])).status_code, 200)
+
+    def test_private_detail_is_not_found_for_others(self):
+        url = reverse("post-details", args=[self.private.pk])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.login(username="other", password="password123")
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(reverse("post-details", args=[self.public.pk])).status_code, 200)
+
+    def test_only_the_author_may_change_a_post(self):
+        self.client.login(username="other", password="password123")
+        response = self.client.post(
+            reverse("post-update", args=[self.public.pk]),
+            {"content": "Taken over by somebody else", "categories": "Mine", "visibility": "public"},
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.post(reverse("post-delete", args=[self.public.pk])).status_code, 404)
+        self.public.refresh_from_db()
+        self.assertEqual(self.public.user, self.author)
+        self.assertEqual(self.public.content, "Anyone may read this post")
+
+
+@override_settings(PAGE_CACHE_VIEWS={})
+class PostCardCacheTest(TestCase):
+    def setUp(self):
+        card_cache().clear()
+        self.user = CustomUser.objects.create(username="cardauthor", email="cardauthor@example.com")
+        self.post = Post.objects.create(user=self.user, content="A cached post card content", categories="Cache")
+
+    def test_second_render_is_a_hit(self):
+        before = card_cache_stats()
+        self.client.get(reverse("posts-list"))
+        self.client.get(reverse("posts-list"))
+        after = card_cache_stats()
+        self.assertEqual(after["misses"] - before["misses"], 1)
+        self.assertEqual(after["hits"] - before["hits"], 1)
+
+    def test_edit_invalidates_card(self):
+        self.client.get(reverse("posts-list"))
+        post = Post.objects.get(pk=self.post.pk)
+        post.content = "Edited content of the cached card"
+        post.save()
+        response = self.client.get(reverse("posts-list"))
+        self.assertContains(response, "Edited content of the cached card")
+
+    def test_author_rename_invalidates_card(self):
+        self.client.get(reverse("posts-list"))
+        user = CustomUser.objects.get(pk=self.user.pk)
+        user.username = "renamedauthor"
+        user.save()
+        response = self.client.get(reverse("posts-list"))
+        self.assertContains(response, "renamedauthor")
+
+
+class AnonymousPageCacheTest(TestCase):
+    def setUp(self):
+        page_cache().clear()
+        self.user = CustomUser.objects.create_user(username="pageowner", email="pageowner@example.com", password="password123")
+        self.post = Post.objects.create(user=self.user, content="A page cached post content", categories="Cache")
+
+    def test_cached_page_skips_the_database(self):
+        first = self.client.get(reverse("posts-list"))
+        self.assertIn("ETag", first)
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse("posts-list"))
+        self.assertEqual(second.content, first.content)
+
+    def test_conditional_get_returns_304(self):
+        first = self.client.get(reverse("post-details", kwargs={"pk": self.post.pk}))
+        response = self.client.get(reverse("post-details", kwargs={"pk": self.post.pk}), HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_post_change_purges_its_pages(self):
+        first = self.client.get(reverse("post-details", kwargs={"pk": self.post.pk}))
+        self.post.content = "Edited page cached post content"
+        self.post.save()
+        response = self.client.get(reverse("post-details", kwargs={"pk": self.post.pk}), HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Edited page cached post content")
+
+    def test_deleted_post_stays_gone_when_the_tag_is_evicted(self):
+        gone = Post.objects.create(user=self.user, content="A post about to be deleted", categories="Cache")
+        # the newest updated_at is not the deleted post's
+        self.post.save()
+        page_cache().delete("page_tag:posts")
+        self.assertContains(self.client.get(reverse("posts-list")), "A post about to be deleted")
+        gone.delete()
+        page_cache().delete("page_tag:posts")
+        self.assertNotContains(self.client.get(reverse("posts-list")), "A post about to be deleted")
+
+    def test_authenticated_users_bypass_the_cache(self):
+        self.client.login(username="pageowner", password="password123")
+        response = self.client.get(reverse("posts-list"))
+        self.assertNotIn("ETag", response)
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        page_cache().clear()
+
+    def test_requests_are_timed_per_view(self):
+        response = self.client.get(reverse("posts-list"))
+        self.assertRegex(response["Server-Timing"], r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries", db-connect;desc="\d+ new connections"$')
+        metrics = self.client.get(reverse("metrics"))
+        self.assertEqual(metrics["Content-Type"], "text/plain; version=0.0.4; charset=utf-8")
+        body = metrics.content.decode()
+        self.assertIn('http_requests_total{view="posts-list",method="GET",status="200"}', body)
+        self.assertIn('http_request_duration_seconds_bucket{view="posts-list",method="GET",le="+Inf"}', body)
+        self.assertIn('http_request_duration_seconds_quantile{view="posts-list",method="GET",quantile="0.99"}', body)
+        self.assertIn('http_request_db_queries_count{view="posts-list"}', body)
+        self.assertIn('post_card_cache_lookups_total{result="hits"}', body)
+
+    def test_new_connections_are_counted(self):
+        before = db_connections_opened.value("default")
+        connection_created.send(sender=type(connection), connection=connection)
+        self.assertEqual(db_connections_opened.value("default"), before + 1)
+        self.assertIn(f'db_connections_opened_total{{database="default"}} {before + 1}', self.client.get(reverse("metrics")).content.decode())
+
+    def test_metrics_are_not_public(self):
+        response = self.client.get(reverse("metrics"), REMOTE_ADDR="203.0.113.9")
+        self.assertNotEqual(response.status_code, 200)
+
+    def test_histogram_quantiles(self):
+        histogram = Histogram("test_seconds", "test", buckets=(1, 2, 4))
+        for value in (0.5, 1.5, 1.5, 3):
+            histogram.observe(value=value)
+        self.assertEqual(histogram.quantile(0.5), 1.5)
+        self.assertEqual(histogram.quantile(1), 4)
+        self.assertIsNone(Histogram("empty", "test").quantile(0.5))
+
+
+class RequestLoggingTest(TestCase):
+    def test_request_id_header(self):
+        response = self.client.get(reverse("home"))
+        self.assertRegex(response["X-Request-ID"], r"^[0-9a-f]{32}$")
+        response = self.client.get(reverse("home"), HTTP_X_REQUEST_ID="proxy-id.1")
+        self.assertEqual(response["X-Request-ID"], "proxy-id.1")
+        response = self.client.get(reverse("home"), HTTP_X_REQUEST_ID="not a valid id")
+        self.assertNotEqual(response["X-Request-ID"], "not a valid id")
+
+    def test_json_records(self):
+        record = logging.LogRecord("posts_app", logging.INFO, __file__, 1, "visited by %s", ("someone",), None)
+        record.request_id = "abc"
+        entry = json.loads(JsonFormatter().format(record))
+        self.assertEqual(entry["message"], "visited by someone")
+        self.assertEqual(entry["request_id"], "abc")
+        self.assertEqual(entry["level"], "INFO")
+
+    def test_listeners_write_to_the_configured_handlers(self):
+        targets = sorted(sorted(handler.name for handler in listener.handlers) for listener in log_handlers._listeners)
+        self.assertEqual(targets, [["console", "file"], ["console", "file_app"]])
+
+    def test_workers_append_to_the_same_file(self):
+        path = os.path.join(tempfile.mkdtemp(), "shared.log")
+        # two processes' handlers on one file, flushing in turn
+        first, second = BufferedFileHandler(path), BufferedFileHandler(path)
+        for i in range(3):
+            for name, handler in (("first", first), ("second", second)):
+                handler.handle(logging.LogRecord("posts_app", logging.INFO, __file__, 1, f"{name} {i}", (), None))
+            first.flush()
+            second.flush()
+        first.close()
+        second.close()
+        with open(path) as lines:
+            self.assertEqual(lines.read().split("\n")[:-1], [f"{name} {i}" for i in range(3) for name in ("first", "second")])
+
+    def test_info_sampling(self):
+        never = SampleInfoFilter(rate=0)
+        info = logging.LogRecord("posts_app", logging.INFO, __file__, 1, "info", (), None)
+        warning = logging.LogRecord("posts_app", logging.WARNING, __file__, 1, "warning", (), None)
+        self.assertFalse(never.filter(info))
+        self.assertTrue(never.filter(warning))
+        self.assertTrue(SampleInfoFilter(rate=1).filter(info))
+
+
+class ErrorPageTest(TestCase):
+    def test_missing_page_is_rendered_in_place(self):
+        response = self.client.get("/no-such-page/")
+        self.assertEqual(response.status_code, 404)
+        self.assertContains(response, "Oops! Page Not Found", status_code=404)
+        self.assertContains(response, "Register Now", status_code=404)
+
+    def test_logged_in_error_page_shows_the_user(self):
+        user = CustomUser.objects.create_user(username="erroruser", email="erroruser@example.com", password="password123")
+        self.client.force_login(user)
+        response = self.client.post(reverse("delete-account", kwargs={"username": user.username}), {"password": "wrong-password"})
+        self.assertContains(response, "Forbidden", status_code=403)
+        self.assertContains(response, "erroruser", status_code=403)
+
+    def test_errors_are_counted(self):
+        before = errors_total.value(404)
+        self.client.get("/no-such-page/")
+        self.assertEqual(errors_total.value(404), before + 1)
+
+
+class PostSearchTest(TestCase):
+    def setUp(self):
+        page_cache().clear()
+        self.user = CustomUser.objects.create_user(username="searcher", email="searcher@example.com", password="password123")
+        self.exact = Post.objects.create(user=self.user, content="Notes about gardening tomatoes at home", categories="Gardening")
+        self.content_only = Post.objects.create(user=self.user, content="Gardening tips for small balconies", categories="Home")
+        Post.objects.create(user=self.user, content="Gardening secrets kept to myself", categories="Gardening", visibility="private")
+        Post.objects.create(user=self.user, content="Completely unrelated post content", categories="Misc")
+
+    def test_ranked_results(self):
+        response = self.client.get(reverse("posts-search"), {"q": "gardening"})
+        self.assertEqual(response.status_code, 200)
+        # the category match ranks first, the private post is not searchable
+        self.assertEqual(list(response.context["posts"]), [self.exact, self.content_only])
+
+    def test_every_term_must_match(self):
+        response = self.client.get(reverse("posts-search"), {"q": "gardening balconies"})
+        self.assertEqual(list(response.context["posts"]), [self.content_only])
+        self.assertContains(self.client.get(reverse("posts-search"), {"q": "nothing"}), "No posts match")
+
+    def test_keyset_pages_over_rank(self):
+        for i in range(25):
+            Post.objects.create(user=self.user, content=f"Another gardening post number {i}", categories="Misc")
+        first = self.client.get(reverse("posts-search"), {"q": "gardening"})
+        page = first.context["page_obj"]
+        second = self.client.get(reverse("posts-search"), {"q": "gardening", "after": page.next_cursor})
+        seen = [post.pk for post in first.context["posts"]] + [post.pk for post in second.context["posts"]]
+        self.assertEqual(len(seen), 27)
+        self.assertEqual(len(set(seen)), 27)
+        self.assertEqual(seen[0], self.exact.pk)
+
+
+class CategoryPostsTest(TestCase):
+    def setUp(self):
+        page_cache().clear()
+        self.user = CustomUser.objects.create_user(username="reader", email="reader@example.com", password="password123")
+        now = timezone.now()
+        self.posts = [
+            Post.objects.create(user=self.user, content=f"Travel story {i}", categories="Travel, Food" if i % 2 else "Travel",
+                                created_at=now - timezone.timedelta(minutes=i))
+            for i in range(25)
+        ]
+        Post.objects.create(user=self.user, content="Unrelated", categories="Misc")
+
+    def test_listing_pages_through_one_category(self):
+        url = reverse("category-posts", args=["travel"])
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertContains(first, "Posts in Travel")
+        second = self.client.get(url, {"after": first.context["page_obj"].next_cursor})
+        seen = list(first.context["posts"]) + list(second.context["posts"])
+        self.assertEqual(seen, self.posts)
+        self.assertEqual(seen[0].excerpt, "Travel story 0")
+        food = self.client.get(reverse("category-posts", args=["food"]))
+        self.assertEqual(list(food.context["posts"]), self.posts[1::2][:20])
+        self.assertEqual(self.client.get(reverse("category-posts", args=["nothing"])).status_code, 404)
+
+    @override_settings(PAGE_CACHE_VIEWS={})
+    def test_listing_query_count(self):
+        card_cache().clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("category-posts", args=["travel"]))
+        # the category, then one query for the links, their posts and authors
+        self.assertEqual(len(queries), 2)
+        self.assertIn("JOIN", queries[1]["sql"])
+
+    def test_home_page_lists_top_categories(self):
+        response = self.client.get(reverse("home"))
+        self.assertEqual([category.slug for category in response.context["top_categories"]], ["travel","food","misc"])
+        self.assertContains(response, reverse("category-posts", args=["food"]))
+
+
+class FeedTest(TestCase):
+    def setUp(self):
+        page_cache().clear()
+        self.reader = CustomUser.objects.create_user(username="feedreader", email="feedreader@example.com", password="password123")
+        self.authors = [
+            CustomUser.objects.create_user(username=f"writer{i}", email=f"writer{i}@example.com", password="password123")
+            for i in range(3)
+        ]
+        self.client.login(username="feedreader", password="password123")
+
+    def write(self, author, minutes_ago, **kwargs):
+        return Post.objects.create(user=author, content=f"A post written {minutes_ago} minutes ago", categories="Feed",
+                                   created_at=timezone.now() - timezone.timedelta(minutes=minutes_ago), **kwargs)
+
+    def feed(self, **params):
+        response = self.client.get(reverse("feed"), params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_follow_and_unfollow(self):
+        old = self.write(self.authors[0], 30)
+        response = self.client.post(reverse("user-follow", args=["writer0"]))
+        self.assertRedirects(response, reverse("user-details", args=["writer0"]))
+        self.authors[0].refresh_from_db()
+        self.assertEqual(self.authors[0].follower_count, 1)
+        # recent posts are copied in on follow, new ones on create
+        new = self.write(self.authors[0], 1)
+        self.write(self.authors[0], 2, visibility="private")
+        self.write(self.authors[1], 3)
+        own = self.write(self.reader, 4, visibility="private")
+        self.assertEqual(list(self.feed().context["posts"]), [new, own, old])
+        self.client.post(reverse("user-unfollow", args=["writer0"]))
+        self.assertEqual(list(self.feed().context["posts"]), [own])
+        self.authors[0].refresh_from_db()
+        self.assertEqual(self.authors[0].follower_count, 0)
+
+    def test_post_made_private_leaves_the_feeds(self):
+        self.client.post(reverse("user-follow", args=["writer0"]))
+        post = self.write(self.authors[0], 1)
+        post.visibility = "private"
+        post.save()
+        self.assertEqual(list(self.feed().context["posts"]), [])
+        post.visibility = "public"
+        post.save()
+        self.assertEqual(list(self.feed().context["posts"]), [post])
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=1)
+    def test_popular_authors_are_pulled(self):
+        fan = CustomUser.objects.create_user(username="fan", email="fan@example.com", password="password123")
+        self.client.post(reverse("user-follow", args=["writer0"]))
+        self.client.post(reverse("user-follow", args=["writer1"]))
+        self.client.login(username="fan", password="password123")
+        self.client.post(reverse("user-follow", args=["writer0"]))
+        self.authors[0].refresh_from_db()
+        self.assertTrue(self.authors[0].feed_pull)
+        self.assertTrue(all(Follow.objects.filter(followee=self.authors[0]).values_list("pull", flat=True)))
+        posts = [self.write(self.authors[i % 2], minutes_ago=i) for i in range(30)]
+        # only writer1's posts and the authors' own entries were copied
+        self.assertEqual(TimelineEntry.objects.filter(user=self.reader).count(), 15)
+        self.assertFalse(TimelineEntry.objects.filter(user=fan).exists())
+        self.client.login(username="feedreader", password="password123")
+        first = self.feed()
+        second = self.feed(after=first.context["page_obj"].next_cursor)
+        self.assertEqual(list(first.context["posts"]) + list(second.context["posts"]), posts)
+        back = self.feed(before=second.context["page_obj"].previous_cursor)
+        self.assertEqual(list(back.context["posts"]), posts[:20])
+
+    def test_read_cost_does_not_grow_with_followees(self):
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                self.feed()
+            return len(queries)
+        follow_view = reverse("user-follow", args=["writer0"])
+        self.client.post(follow_view)
+        self.write(self.authors[0], 1)
+        few = count_queries()
+        for i in range(3, 13):
+            author = CustomUser.objects.create_user(username=f"writer{i}", email=f"writer{i}@example.com", password="password123")
+            self.client.post(reverse("user-follow", args=[author.username]))
+            self.write(author, i)
+        self.assertEqual(count_queries(), few)
+
+    def test_feed_needs_login(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse("feed")).status_code, 302)
+        self.assertEqual(self.client.post(reverse("user-follow", args=["writer0"])).status_code, 302)
+        self.assertFalse(Follow.objects.exists())
+
+    def test_deleted_accounts_leave_the_follower_counts(self):
+        for name in ("writer0", "writer1"):
+            self.client.post(reverse("user-follow", args=[name]))
+        self.reader.delete()
+        counts = CustomUser.objects.filter(username__startswith="writer").values_list("follower_count", flat=True)
+        self.assertEqual(list(counts), [0, 0, 0])
+        self.assertFalse(Follow.objects.exists())
+
+
+class ReplicaRoutingTest(TestCase):
+    def setUp(self):
+        page_cache().clear()
+        self.user = CustomUser.objects.create_user(username="writer", email="writer@example.com", password="password123")
+
+    @override_settings(DATABASE_REPLICAS=["replica1"])
+    def test_router(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(Post), "default")
+        with use_replica() as alias:
+            self.assertEqual(alias, "replica1")
+            self.assertEqual(router.db_for_read(Post), "replica1")
+            self.assertEqual(router.db_for_write(Post), "default")
+        self.assertEqual(router.db_for_read(Post), "default")
+        self.assertFalse(router.allow_migrate("replica1", "posts_app"))
+        self.assertTrue(router.allow_migrate("default", "posts_app"))
+
+    # "default" stands in for a replica: the test database has no other alias
+    @override_settings(DATABASE_REPLICAS=["default"])
+    def test_list_and_detail_reads_go_to_a_replica(self):
+        post = Post.objects.create(user=self.user, content="Replicated content", categories="Misc")
+        self.assertEqual(self.client.get(reverse("posts-list")).wsgi_request.read_replica, "default")
+        self.assertEqual(self.client.get(reverse("post-details", args=[post.pk])).wsgi_request.read_replica, "default")
+        self.assertIsNone(self.client.get(reverse("home")).wsgi_request.read_replica)
+
+    @override_settings(DATABASE_REPLICAS=["default"])
+    def test_writers_stick_to_default(self):
+        self.client.login(username="writer", password="password123")
+        response = self.client.post(reverse("new-post"), {"visibility":"public","categories":"Misc","content":"A brand new post to read back"})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(STICKY_COOKIE, response.cookies)
+        self.assertIsNone(self.client.get(reverse("posts-list")).wsgi_request.read_replica)
+        self.client.cookies.pop(STICKY_COOKIE)
+        self.assertEqual(self.client.get(reverse("posts-list")).wsgi_request.read_replica, "default")
+
+    def test_no_replicas_configured(self):
+        response = self.client.get(reverse("posts-list"))
+        self.assertIsNone(response.wsgi_request.read_replica)
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+
+class AsyncViewsTest(TestCase):
+    def setUp(self):
+        page_cache().clear()
+        self.user = CustomUser.objects.create_user(username="asyncreader", email="asyncreader@example.com", password="password123")
+        self.post = Post.objects.create(user=self.user, content="Served from the event loop", categories="Async")
+
+    async def test_read_views_under_asgi(self):
+        for url in [reverse("posts-list"), reverse("users-list"), reverse("post-details", args=[self.post.pk]),
+                    reverse("user-posts", args=[self.user.username])]:
+            response = await self.async_client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertContains(response, "asyncreader")
+        page_cache().clear()
+        response = await self.async_client.get(reverse("posts-list"))
+        self.assertEqual(list(response.context["posts"]), [self.post])
+        self.assertIn("X-Request-ID", response)
+        self.assertIn("Server-Timing", response)
+
+    async def test_logged_in_user_and_errors(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse("posts-list"))
+        self.assertContains(response, reverse("user-details", args=[self.user.username]))
+        missing = await self.async_client.get(reverse("post-details", args=[self.post.pk + 100]))
+        self.assertEqual(missing.status_code, 404)
+        self.assertContains(missing, "Oops! Page Not Found", status_code=404)
+        self.assertContains(missing, "asyncreader", status_code=404)
+
+    @override_settings(DATABASE_REPLICAS=["default"])
+    async def test_replica_choice_reaches_the_async_view(self):
+        response = await self.async_client.get(reverse("posts-list"))
+        self.assertEqual(response.asgi_request.read_replica, "default")
+
+    def test_custom_middleware_stays_async(self):
+        from django.conf import settings
+        from django.utils.module_loading import import_string
+        from asgiref.sync import iscoroutinefunction
+
+        async def get_response(request):
+            return None
+
+        for path in settings.MIDDLEWARE:
+            if path.startswith("posts_app."):
+                self.assertTrue(iscoroutinefunction(import_string(path)(get_response)), path)
+
+
+
+class JsonApiTest(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username="apiwriter", email="apiwriter@example.com", password="password123")
+        now = timezone.now()
+        self.posts = [
+            Post.objects.create(user=self.user, content=f"Post number {i} for the API", categories="Api",
+                                created_at=now - timezone.timedelta(minutes=i))
+            for i in range(7)
+        ]
+        Post.objects.create(user=self.user, content="Not for the API at all", categories="Api", visibility="private")
+
+    def get_json(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/json")
+        return json.loads(b"".join(response.streaming_content))
+
+    def test_posts_are_paged_with_cursors(self):
+        seen = []
+        params = {"limit": 3}
+        while True:
+            data = self.get_json(reverse("api-posts"), **params)
+            seen += [row["id"] for row in data["results"]]
+            if data["next"] is None:
+                break
+            params["after"] = data["next"]
+        self.assertEqual(seen, [post.pk for post in self.posts])
+        everything = self.get_json(reverse("api-posts"), limit=0)
+        self.assertEqual([row["id"] for row in everything["results"]], seen)
+        self.assertIsNone(everything["next"])
+
+    def test_field_selection(self):
+        data = self.get_json(reverse("api-posts"), fields="username,content", limit=1)
+        self.assertEqual(data["results"], [{"username": "apiwriter", "content": "Post number 0 for the API"}])
+        row = self.get_json(reverse("api-posts"), limit=1)["results"][0]
+        self.assertEqual(set(row), {"id", "user_id", "excerpt", "categories", "created_at"})
+        self.assertEqual(row["created_at"], self.posts[0].created_at.isoformat())
+        users = self.get_json(reverse("api-users"))["results"]
+        self.assertEqual([user["username"] for user in users], ["apiwriter"])
+        self.assertNotIn("email", users[0])
+
+    def test_bad_requests(self):
+        for params in ({"fields": "id,email"}, {"limit": "-1"}, {"limit": "many"}, {"after": "not-a-cursor"}):
+            response = self.client.get(reverse("api-users"), params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn("error", response.json())
+        # a well-formed cursor with a number where the date goes
+        response = self.client.get(reverse("api-posts"), {"after": encode_cursor([123, 1])})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertIn("error", response.json())
+
+    def test_users_lists_active_members_only(self):
+        CustomUser.objects.create_user(username="gone", email="gone@example.com", password="password123", is_active=False)
+        CustomUser.objects.create_user(username="moderator", email="mod@example.com", password="password123", is_staff=True)
+        CustomUser.objects.create_superuser(username="root", email="root@example.com", password="password123")
+        users = self.get_json(reverse("api-users"))["results"]
+        self.assertEqual([user["username"] for user in users], ["apiwriter"])
+
+    async def test_streams_under_asgi(self):
+        response = await self.async_client.get(reverse("api-posts"), {"limit": 5, "fields": "id"})
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(b"".join([chunk async for chunk in response.streaming_content]))
+        self.assertEqual([row["id"] for row in data["results"]], [post.pk for post in self.posts[:5]])
+        self.assertIsNotNone(data["next"])
+
+
+@override_settings(RATE_LIMITS={"login": [("ip", 3, 60), ("username", 2, 60)], "new-post": [("username", 1, 60)]})
+class RateLimitTest(TestCase):
+    def setUp(self):
+        caches["rate_limits"].clear()
+        ratelimit.local_buckets.buckets.clear()
+        self.clock = 1_000_000.0
+        patcher = mock.patch("posts_app.ratelimit.now", lambda: self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def login(self, username, ip="10.0.0.1"):
+        return self.client.post(reverse("login"), {"username": username, "password": "wrong"}, REMOTE_ADDR=ip)
+
+    def test_buckets_by_username_and_ip(self):
+        self.assertEqual(self.login("victim").status_code, 200)
+        self.assertEqual(self.login("Victim", ip="10.0.0.2").status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            refused = self.login("victim", ip="10.0.0.3")
+        self.assertEqual(refused.status_code, 429)
+        self.assertEqual(refused["Retry-After"], "30")
+        self.assertEqual(len(queries), 0)
+        # other usernames from the first address are let through, the
+        # refused request took none of its 3 tokens
+        self.assertEqual(self.login("someone").status_code, 200)
+        self.assertEqual(self.login("nobody").status_code, 200)
+        self.assertEqual(self.login("anybody").status_code, 429)
+        self.assertEqual(self.client.get(reverse("login"), REMOTE_ADDR="10.0.0.1").status_code, 200)
+
+    def test_buckets_refill(self):
+        for _ in range(2):
+            self.login("victim")
+        self.assertEqual(self.login("victim").status_code, 429)
+        self.clock += 29
+        self.assertEqual(self.login("victim").status_code, 429)
+        self.clock += 1
+        self.assertEqual(self.login("victim").status_code, 200)
+        # a long pause refills up to the burst, not beyond
+        self.clock += 3600
+        self.assertEqual([self.login("victim", ip=f"10.0.1.{i}").status_code for i in range(3)], [200, 200, 429])
+
+    def test_logged_in_users_are_limited_by_session(self):
+        user = CustomUser.objects.create_user(username="poster", email="poster@example.com", password="password123")
+        self.client.force_login(user)
+        data = {"visibility": "public", "categories": "Misc", "content": "A post written by a busy poster"}
+        self.assertEqual(self.client.post(reverse("new-post"), data).status_code, 302)
+        self.assertEqual(self.client.post(reverse("new-post"), data).status_code, 429)
+        self.assertEqual(Post.objects.count(), 1)
+
+    def test_upload_is_not_parsed_before_the_view(self):
+        user = CustomUser.objects.create_user(username="poster", email="poster@example.com", password="password123")
+        self.client.force_login(user)
+        request = RequestFactory().post(reverse("new-post"), {"content": "x", "username": "someone-else"})
+        request.COOKIES[settings.SESSION_COOKIE_NAME] = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        middleware = RateLimitMiddleWare(lambda request: None)
+        self.assertEqual(middleware.identify(request, "new-post", "username"), request.COOKIES[settings.SESSION_COOKIE_NAME])
+        self.assertFalse(hasattr(request, "_post"))
+
+    @override_settings(RATE_LIMIT_IP_HEADER="HTTP_X_REAL_IP", RATE_LIMIT_TRUSTED_PROXIES=["172.16.0.0/12"])
+    def test_ip_header_only_from_trusted_proxies(self):
+        def login(username, real_ip, proxy):
+            return self.client.post(reverse("login"), {"username": username, "password": "wrong"},
+                                    REMOTE_ADDR=proxy, HTTP_X_REAL_IP=real_ip)
+        # a client talking to the app directly cannot pick its address
+        statuses = [login(f"user{i}", f"10.9.9.{i}", "203.0.113.7").status_code for i in range(4)]
+        self.assertEqual(statuses, [200, 200, 200, 429])
+        # behind the proxy every client has its own bucket
+        statuses = [login(f"user{i}", f"10.9.9.{i}", "172.18.0.5").status_code for i in range(4)]
+        self.assertEqual(statuses, [200, 200, 200, 200])
+
+    def test_local_buckets_when_the_cache_fails(self):
+        with mock.patch.object(ratelimit.CacheBuckets, "take", side_effect=ConnectionError("cache down")):
+            statuses = [self.login("victim").status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
 
+    async def test_refused_under_asgi(self):
+        for _ in range(2):
+            await self.async_client.post(reverse("login"), {"username": "victim", "password": "wrong"})
+        response = await self.async_client.post(reverse("login"), {"username": "victim", "password": "wrong"})
+        self.assertEqual(response.status_code, 429)